@@ -32,27 +32,48 @@
 
 import os
 import re
+import mmap
+import marshal
+import cPickle
+import hashlib
 import textwrap
-from OrderedDict import OrderedDict
+import sys
+import array
+import bisect
+import fnmatch
+import threading
+from itertools import izip, islice
+from collections import namedtuple, OrderedDict
 from optparse import OptionParser, OptionValueError
+from multiprocessing.pool import ThreadPool
 
 class InvalidSyntax(Exception):
-    def __init__(self, lineno, msg):
+    def __init__(self, lineno, msg, filename=None):
         self.lineno = lineno
         self.msg = msg
+        self.filename = filename
 
     def __str__(self):
-        return '%s (on line %s)' % (self.msg, self.lineno)
+        if self.filename is None:
+            return '%s (on line %s)' % (self.msg, self.lineno)
+        else:
+            return '%s (on line %s of %s)' % (self.msg, self.lineno, self.filename)
 
 
 class MissingName(InvalidSyntax):
-    def __init__(self, lineno):
-        InvalidSyntax.__init__(self, lineno, 'Could not find variable name')
+    def __init__(self, lineno, filename=None):
+        InvalidSyntax.__init__(self, lineno, 'Could not find variable name', filename)
 
 
 class UnregisteredName(InvalidSyntax):
-    def __init__(self, lineno, name):
-        InvalidSyntax.__init__(self, lineno, 'Unregistered name: %r' % name)
+    def __init__(self, lineno, name, filename=None):
+        InvalidSyntax.__init__(self, lineno, 'Unregistered name: %r' % name, filename)
+
+
+class InvalidValue(InvalidSyntax):
+    def __init__(self, lineno, name, error, filename=None):
+        InvalidSyntax.__init__(self, lineno, 'Invalid value for %s: %s' % (name, error),
+                               filename)
 
 
 class GroupExpectsNoValue(Exception):
@@ -66,34 +87,343 @@ class GroupExpectsNoValue(Exception):
 def wrap(comment):
     return textwrap.wrap(' '.join(comment.split()))
 
+_comments = {} # comment -> its wrapped lines, ready to write
+def commentLines(comment):
+    """Returns the given comment wrapped into '#'-prefixed lines, as written to
+    configuration files.  The result is cached."""
+    try:
+        return _comments[comment]
+    except KeyError:
+        lines = ''.join(['# %s\n' % line for line in wrap(comment)])
+        _comments[comment] = lines
+        return lines
+
 def writeComment(fp, comment):
-    for line in wrap(comment):
-        fp.write('# %s\n' % line)
+    fp.write(commentLines(comment))
     
 def OptparseCallback(option, optString, valueString, parser, Value):
     try:
-        Value.setFromString(valueString)
+        Value.setFromString(valueString, CLI)
     except ValueError, e:
         raise OptionValueError('%s option expected %s, received %r (%s)' %
                                (optString, Value.type(), valueString, e))
         
 
+# Held while changing the shape of any tree.  get() only takes it when it has to
+# create a child, so that concurrent gets of the same name create only one.
+_lock = threading.RLock()
+
+# Incremented whenever any value is set or reset, or any tree changes shape;
+# memoized defaults are only valid for the version they were computed in.
+_version = 0
+def _changed():
+    global _version
+    _version += 1
+
+# The layers a value can be set in.  A variable's value is the one set in its highest
+# layer, or its default if it has been set in none; so a value given on the command
+# line wins over one read from the environment, which wins over one read from a file.
+(DEFAULTS, FILES, ENV, CLI, RUNTIME) = range(5)
+
+# Per-thread state: _local.overrides is a dict mapping variables to the thread's
+# overrides (see Group.override), and _local.recording the set of variables read while
+# recording dependencies (see Group.subscribe).  _special counts the overrides and
+# recordings active in all threads, so that variables needn't look at _local unless
+# some thread has any.
+_local = threading.local()
+_special = 0
+
+def _addSpecial(n):
+    global _special
+    _lock.acquire()
+    try:
+        _special += n
+    finally:
+        _lock.release()
+
+class Override(object):
+    """A context manager giving variables temporary values in the current thread
+    only; see Group.override.  Overrides nest, inner ones winning."""
+    __slots__ = ('_settings', '_previous')
+
+    def __init__(self, settings):
+        """
+        @param settings: A dict mapping variables to their overriding values.
+        """
+        self._settings = settings
+        self._previous = None
+
+    def __enter__(self):
+        previous = getattr(_local, 'overrides', None)
+        if previous:
+            current = dict(previous)
+            current.update(self._settings)
+        else:
+            current = self._settings
+        self._previous = previous
+        _local.overrides = current
+        _addSpecial(1)
+        return self
+
+    def __exit__(self, *exc_info):
+        _local.overrides = self._previous
+        self._previous = None
+        _addSpecial(-1)
+
+# Subscriptions (see Group.subscribe).  _subscribers maps nodes to lists of callbacks;
+# _watched maps each variable whose value subscribers are told about to its last known
+# value; _dependents maps variables to the watched variables whose defaults read them,
+# and _dependencies each watched variable to the variables its default read.
+_subscribers = {}
+_watched = {}
+_dependents = {}
+_dependencies = {}
+
+def _evaluate(variable):
+    """Returns the value of the given variable, recording the variables read by its
+    default as its dependencies.  Overrides are ignored, since they only apply to
+    the thread which made them.  Values set lazily aren't converted: a variable's
+    own pending value string is returned as it is, and if its default reads a value
+    which can't be converted, its last known value is returned, leaving the error
+    to be reported when the value is read (or by validateAll)."""
+    if variable._raw is not None:
+        value = variable._raw
+        recording = set()
+    else:
+        previous = (getattr(_local, 'recording', None), getattr(_local, 'overrides', None))
+        _local.recording = recording = set()
+        _local.overrides = None
+        _addSpecial(1)
+        try:
+            value = variable()
+        except ValueError:
+            value = _watched.get(variable)
+        finally:
+            (_local.recording, _local.overrides) = previous
+            _addSpecial(-1)
+    recording.discard(variable)
+    for dependency in _dependencies.pop(variable, ()):
+        if dependency not in recording:
+            dependents = _dependents[dependency]
+            dependents.discard(variable)
+            if not dependents:
+                del _dependents[dependency]
+    if recording:
+        _dependencies[variable] = recording
+        for dependency in recording:
+            _dependents.setdefault(dependency, set()).add(variable)
+    return value
+
+def _unwatch(variable):
+    _watched.pop(variable, None)
+    for dependency in _dependencies.pop(variable, ()):
+        dependents = _dependents[dependency]
+        dependents.discard(variable)
+        if not dependents:
+            del _dependents[dependency]
+
+def _subscribed(node):
+    """Returns whether the given node or any of its ancestors has subscribers."""
+    while node is not None:
+        if node in _subscribers:
+            return True
+        node = node._parent
+    return False
+
+def _noteChange(variable):
+    if getattr(_local, 'depth', 0):
+        changed = getattr(_local, 'changed', None)
+        if changed is None:
+            changed = _local.changed = set()
+        changed.add(variable)
+    else:
+        _notify([variable])
+
+def _notify(changed):
+    """Calls each subscriber once with all the changes, if any, to the values watched
+    for it caused by the given changed variables."""
+    batches = {}
+    _lock.acquire()
+    try:
+        candidates = set()
+        for variable in changed:
+            if variable in _watched or _subscribed(variable):
+                candidates.add(variable)
+            candidates.update(_dependents.get(variable, ()))
+        for variable in candidates:
+            old = _watched.get(variable)
+            new = _watched[variable] = _evaluate(variable)
+            if type(old) is type(new) and old == new:
+                continue
+            name = variable._fullname()
+            node = variable
+            while node is not None:
+                for callback in _subscribers.get(node, ()):
+                    # By id, since bound methods of unhashable objects are unhashable.
+                    batch = batches.setdefault(id(callback), (callback, {}))[1]
+                    batch[name] = (name, old, new)
+                node = node._parent
+    finally:
+        _lock.release()
+    # Every subscriber is told, even if an earlier one raises; the first exception is
+    # re-raised once they all have been.
+    exc_info = None
+    for (callback, batch) in batches.itervalues():
+        try:
+            callback(sorted(batch.itervalues()))
+        except Exception:
+            if exc_info is None:
+                exc_info = sys.exc_info()
+    if exc_info is not None:
+        raise exc_info[0], exc_info[1], exc_info[2]
+
+class Transaction(object):
+    """A context manager collecting the changes made in the current thread while it's
+    active, so that subscribers (see Group.subscribe) are told about all of them at
+    once, when the outermost transaction ends.  Reading a file, the environment, or
+    the command line is a transaction of its own, as is each set() outside any."""
+    __slots__ = ()
+
+    def __enter__(self):
+        _local.depth = getattr(_local, 'depth', 0) + 1
+        return self
+
+    def __exit__(self, *exc_info):
+        _local.depth -= 1
+        if not _local.depth:
+            changed = getattr(_local, 'changed', None)
+            if changed:
+                _local.changed = None
+                _notify(changed)
+
+def fingerprint(filename):
+    """Returns a (filename, size, mtime, sha1 hexdigest) tuple for the given file."""
+    fp = open(filename, 'rb')
+    try:
+        st = os.fstat(fp.fileno())
+        return (filename, st.st_size, st.st_mtime, hashlib.sha1(fp.read()).hexdigest())
+    finally:
+        fp.close()
+
+def unchanged(filename, size, mtime, digest):
+    """Returns whether the given file still matches a fingerprint.  The file's content
+    is only hashed when its size matches but its modification time doesn't."""
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return False
+    if st.st_size != size:
+        return False
+    elif st.st_mtime == mtime:
+        return True
+    else:
+        return fingerprint(filename)[3] == digest
+
+class Changes(namedtuple('Changes', 'added changed removed')):
+    """The lists of names of the variables a reload added, changed, and removed."""
+    __slots__ = ()
+
+
+# The types of the values snapshots store with marshal; others are pickled.
+_marshalled = frozenset([bool, int, long, float, complex, str, unicode,
+                         tuple, list, dict, set, frozenset])
+
+_noValue = object() # The value of a Frozen group.
+def _freeze(node, previous):
+    """Returns a Frozen copy of the given node, reusing the previous copy, or any of
+    its descendants, wherever nothing has changed."""
+    if node.expectsValue():
+        value = node()
+    else:
+        value = _noValue
+    same = previous is not None and type(previous._value) is type(value) and \
+           previous._value == value
+    children = None
+    if node._order:
+        children = {}
+        previousChildren = {}
+        if previous is not None and previous._children:
+            previousChildren = previous._children
+        for child in node._order:
+            previousChild = previousChildren.get(child._name)
+            frozen = _freeze(child, previousChild)
+            children[child._name] = frozen
+            if frozen is not previousChild:
+                same = False
+        if len(children) != len(previousChildren):
+            same = False
+    elif previous is not None and previous._children:
+        same = False
+    if same:
+        return previous
+    return Frozen(node._name, value, children)
+
+_wildcard = re.compile(r'[*?[]')
+def _match(children, order, segments, i, found, seen):
+    """Appends to found the nodes among the given children, or their descendants,
+    whose names match the dotted pattern segments from the i'th on (see Group.find).
+    Children are given as both their dict and their ordered list, so that segments
+    without wildcards can be looked up rather than compared with every child."""
+    segment = segments[i]
+    rest = segments[i+1:]
+    if segment == '**':
+        if not rest:
+            for child in order:
+                for node in child._subtree():
+                    if id(node) not in seen:
+                        seen.add(id(node))
+                        found.append(node)
+            return
+        _match(children, order, segments, i + 1, found, seen) # No segments at all.
+        for child in order:
+            if child._order:
+                _match(child._children, child._order, segments, i, found, seen)
+        return
+    if _wildcard.search(segment):
+        matches = [child for child in order if fnmatch.fnmatchcase(child._name, segment)]
+    elif segment in children:
+        matches = [children[segment]]
+    else:
+        return
+    for node in matches:
+        if not rest or rest.count('**') == len(rest):
+            if id(node) not in seen:
+                seen.add(id(node))
+                found.append(node)
+        if rest and node._order:
+            _match(node._children, node._order, segments, i + 1, found, seen)
+
+
 class IgnoreValue(object):
     """Used non-strict Groups to ignore the value in readfp."""
     def expectsValue(self):
         return True
-    def setFromString(self, s):
+    def fromString(self, s):
+        return s
+    def set(self, v, layer=None):
+        return
+    def setFromString(self, s, layer=None):
+        return
+    def setFromStringLazily(self, s, layer=None):
         return
 
 class Group(object):
     """All configuration variables are groups, that is, all configuration variables can have other groups and variables registered under them.  Experience (from the very similar configuration in Supybot) has shown that making non-group variables is simply not worth the trouble and inconsistency."""
-    def __init__(self, name, comment=None, Child=None, strict=True):
+    # Trees can have very many nodes, so nodes have no instance dictionary and
+    # the containers for children are only allocated once a child is registered.
+    __slots__ = ('_name', '_parent', '_Child', '_strict', '_comment', '_children',
+                 '_order', '_index', '_cachedFullname', '_shapeCache', '_flyweight',
+                 '_loaded', '_published', '_dirty')
+
+    def __init__(self, name, comment=None, Child=None, strict=True, flyweight=False):
         """
         @param name: The name for this group.  An argument could be made for making the group itself name-agnostic and only giving it a name upon registration with another group, but that would cripple unregistered groups.
 
         @param comment: A helpful comment indicating the usage/meaning of a particular group.  This comment will be written to configuration files and used as the help text of the optparse OptionParser the group can generate.
 
         @param Child: A callable (usually a class) which, if not None, will be used in the get() method to create a requested child rather than raising KeyError.
+
+        @param flyweight: Flag determining whether children requested through the Child argument are created only when they're given a value.  Until then get() returns a Placeholder, and all the placeholders' reads are answered by a single instance of Child shared by the whole group.
         """
         # All of these are prefixed with underscores so they won't conflict with
         # registered children.
@@ -104,22 +434,46 @@ class Group(object):
         self._Child = Child
         self._strict = strict
         self._comment = comment
-        self._children = OrderedDict()
+        self._children = None # name -> child
+        self._order = None # children, in order of registration
+        self._index = None
+        self._cachedFullname = None
+        self._shapeCache = None
+        self._flyweight = None
+        self._loaded = None # filename -> {name: value string}, in read order, for reload.
+        self._published = None
+        self._dirty = 0 # The number of variables in this subtree which aren't default.
+        if flyweight:
+            if Child is None:
+                raise ValueError('Flyweight group %r needs a Child to create its '
+                                 'flyweight with.' % name)
+            self._flyweight = Child(name)
+            self._flyweight._parent = self # For hieropt.parent; it isn't registered.
 
     def get(self, name):
         """Returns the child variable with the given name.  If no such variable exists and the Child argument was given to __init__, a new variable will be created and returned.
 
         @param name: The name of the child to retrieve.
         """
-        try:
-            return self._children[name]
-        except KeyError:
-            if self._Child is not None:
-                child = self._Child(name)
-                self.register(child)
+        children = self._children
+        if children is not None:
+            child = children.get(name)
+            if child is not None:
                 return child
+        if self._Child is None:
+            raise KeyError(name)
+        _lock.acquire()
+        try:
+            # Another thread may have created the child since we looked.
+            children = self._children
+            if children is not None and name in children:
+                return children[name]
+            elif self._flyweight is not None:
+                return self.register(Placeholder(name))
             else:
-                raise
+                return self.register(self._Child(name))
+        finally:
+            _lock.release()
     
     def __getattr__(self, name):
         if name.startswith('_'):
@@ -140,11 +494,207 @@ class Group(object):
 
         @param child: The child to register.
         """
-        self._children[child._name] = child
+        _lock.acquire()
+        try:
+            return self._register(child)
+        finally:
+            _lock.release()
+
+    def _register(self, child):
+        # The shape of this group and all its ancestors changes, so their cached
+        # traversals are dropped.  The child's own caches hold names relative to
+        # the child, so they remain valid.
+        root = self
+        root._shapeCache = None
+        while root._parent is not None:
+            root = root._parent
+            root._shapeCache = None
+        index = root._index
         child._parent = self
+        if child._index is not None:
+            child._index = None # Only the root of a tree keeps an index.
+        subtree = child._subtree()
+        for node in subtree:
+            node._cachedFullname = None
+        # Only now, with the child ready, is it made visible to get(), which reads
+        # children without taking the lock.
+        if self._children is None:
+            self._order = []
+            self._children = {}
+        old = self._children.get(child._name)
+        if old is None:
+            self._order.append(child)
+        else:
+            self._order[self._order.index(old)] = child
+            if index is not None:
+                for node in old._subtree():
+                    index.pop(node._fullname(), None)
+        self._children[child._name] = child
+        dirty = child._dirty
+        if old is not None:
+            dirty -= old._dirty
+        if dirty:
+            node = self
+            while node is not None:
+                node._dirty += dirty
+                node = node._parent
+        _changed()
+        if index is not None:
+            for node in subtree:
+                index[node._fullname()] = node
         return child
 
+    def _subtree(self):
+        """Returns a list of this group and all its descendants, in preorder."""
+        nodes = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            nodes.append(node)
+            if node._order is not None:
+                stack.extend(reversed(node._order))
+        return nodes
+
+    def _flatten(self):
+        """Returns a cached list of the (name, node) pairs generated by __iter__."""
+        cache = self._shapeCache
+        if cache is None:
+            cache = self._shapeCache = {}
+        try:
+            return cache['flat']
+        except KeyError:
+            # Names are sliced from the cached full names rather than built up
+            # level by level; for a root group the slice is the full name itself.
+            offset = len(self._fullname()) - len(self._name)
+            flat = [(node._fullname()[offset:], node) for node in self._subtree()]
+            cache['flat'] = flat
+            return flat
+
+    def variables(self):
+        """Returns a list of (name, configuration variable) pairs, like those generated
+        by __iter__, but leaving out the groups which expect no value."""
+        cache = self._shapeCache
+        if cache is None:
+            cache = self._shapeCache = {}
+        try:
+            return cache['variables']
+        except KeyError:
+            variables = [(name, node) for (name, node) in self._flatten()
+                         if node.expectsValue()]
+            cache['variables'] = variables
+            return variables
+
+    def _root(self):
+        node = self
+        while node._parent is not None:
+            node = node._parent
+        return node
+
+    def lookup(self, name):
+        """Returns the variable with the given dotted name, which (like the names in
+        configuration files read by this group) begins with this group's own name.
+        Names are resolved through an index of full names kept on the root of the
+        tree, so the cost of a lookup doesn't depend on the depth of the variable.
+        Names not in the index are resolved via get(), so groups with a Child
+        argument still create requested children.
+
+        @param name: The dotted name of the variable to retrieve.
+        """
+        if name.split('.', 1)[0] != self._name:
+            raise KeyError(name)
+        root = self._root()
+        if root._index is None:
+            root._index = dict(root._flatten())
+        if self is root:
+            fullname = name
+        else:
+            fullname = '%s.%s' % (self._parent._fullname(), name)
+        try:
+            return root._index[fullname]
+        except KeyError:
+            parts = name.split('.')[1:]
+            node = self
+            for part in parts:
+                node = node.get(part)
+            return node
+
+    def find(self, pattern):
+        """Returns a list of (name, node) pairs, like those generated by __iter__, for the
+        nodes of this group whose dotted names (beginning with this group's own name,
+        as with lookup) match the given pattern.  Within a segment of the pattern,
+        '*' matches any characters but '.', as do fnmatch's other wildcards; a segment
+        of '**' matches any number of segments, none included.  The tree is searched
+        from this group down, following only branches which can match: segments
+        without wildcards are looked up directly, so the cost depends on the number of
+        matches and of the children at wildcard segments, not the size of the tree.
+
+            config.find('config.db.*.pool.size')
+            config.find('config.tenants.**.timeout')
+
+        @param pattern: The pattern to match.
+        """
+        found = []
+        _match({self._name: self}, [self], pattern.split('.'), 0, found, set())
+        offset = len(self._fullname()) - len(self._name)
+        return [(node._fullname()[offset:], node) for node in found]
+
+    def setMatching(self, pattern, s, layer=RUNTIME):
+        """Sets every variable matching the given pattern (see find) from the given
+        string, in one transaction.  The string is converted for every variable before
+        any is set, so a string invalid for any of them sets nothing.  Returns the
+        names of the variables set.
+
+        @param pattern: The pattern to match.
+        @param s: The value, in string form.
+        @param layer: The layer to set the values in (see Value.set).
+        """
+        names = []
+        converted = []
+        for (name, node) in self.find(pattern):
+            if not node.expectsValue():
+                continue
+            # Placeholders convert through their flyweight; they're only materialized
+            # once every conversion has succeeded.
+            names.append(name)
+            converted.append((node, node.fromString(s)))
+        with Transaction():
+            for (variable, value) in converted:
+                if isinstance(variable, Placeholder):
+                    variable = variable._materialize()
+                variable.set(value, layer)
+        return names
+
+    def override(self, settings):
+        """Returns a context manager which, while active, gives the named variables the
+        given values in the current thread only, over whatever layer their values come
+        from.  Nothing is copied: entering and leaving cost only as much as the number
+        of overrides, and variables not overridden are unaffected.  Defaults aren't
+        memoized by a thread with overrides, since they may depend on them.
+
+            with config.override({'config.timeout': 5}):
+                handle(request)
+
+        @param settings: A dict mapping the dotted names of variables (see lookup) to
+                         their overriding values.
+        """
+        variables = {}
+        for (name, value) in settings.iteritems():
+            variable = self.lookup(name)
+            if isinstance(variable, Placeholder):
+                variable = variable._materialize()
+            variables[variable] = value
+        return Override(variables)
+
     def _fullname(self, parentName=None, childName=None):
+        if parentName is None and childName is None:
+            fullname = self._cachedFullname
+            if fullname is None:
+                if self._parent is None:
+                    fullname = self._name
+                else:
+                    fullname = '%s.%s' % (self._parent._fullname(), self._name)
+                self._cachedFullname = fullname
+            return fullname
         if childName is None:
             childName = self._name
         if parentName is None and self._parent is not None:
@@ -154,102 +704,714 @@ class Group(object):
         else:
             return '%s.%s' % (parentName, childName)
         
-    def writefp(self, fp, annotate=True, parentName=None):
-        """Writes this configuration group and its children in their current state to the given file(-like) object. 
+    def writefp(self, fp, annotate=True, parentName=None, materializedOnly=False,
+                onlyChanged=False):
+        """Writes this configuration group and its children in their current state to the given file(-like) object.  The output is gathered and written with a single call to fp.write.
 
         @param fp: The file(-like) object to write.
         @param annotate: Flag determining whether to write comments to the given file object.  Default values are still written, but commented out.
-        @param parentName: The name of the parent to prefix to this group's own name and the name of its children.
+        @param parentName: The name of the parent to prefix to this group's own name and the name of its children.  Defaults to the full name of this group's parent.
+        @param materializedOnly: Flag determining whether to skip the placeholders of unset children in flyweight groups.
+        @param onlyChanged: Flag determining whether to write only the variables which aren't default (and the comments of the groups containing them).  Subtrees with no such variables are skipped without being walked.
         """
+        out = []
+        self._write(out, annotate, parentName, materializedOnly, onlyChanged)
+        fp.write(''.join(out))
+
+    def _write(self, out, annotate, parentName, materializedOnly, onlyChanged):
+        if onlyChanged and not self._dirty:
+            return
         if self._comment and annotate:
-            writeComment(fp, self._comment)
-            fp.write('\n')
-        myname = self._fullname(parentName)
-        for child in self.children():
-            child.writefp(fp, annotate=annotate, parentName=myname)
+            out.append(commentLines(self._comment))
+            out.append('\n')
+        myname = None
+        if parentName is not None:
+            myname = self._fullname(parentName)
+        for child in self.children(materializedOnly):
+            child._write(out, annotate, myname, materializedOnly, onlyChanged)
 
     _sepRe = re.compile(r'\s*[:=]\s*')
-    def readfp(self, fp):
-        """Reads the given file object, setting the state of this configuration group and its children appropriately.  Comment lines and blank lines are ignored; comment lines are those which begin (apart from leading whitespace) with a '#' character.  Comments cannot be initiated part way through a line: e.g., a line 'foo: bar # baz' gives the 'foo' configuration variable the literal value 'bar # baz'.  Non-comment lines consist of a configuration variable name followed by optional whitespace, a separator of ':' or '=', more optional whitespace, and finally the value of that variable in string form."""
-        lineno = 0
-        for line in fp:
-            lineno += 1
+    def readfp(self, fp, lazy=False):
+        """Reads the given file object, setting the state of this configuration group and its children appropriately.  Comment lines and blank lines are ignored; comment lines are those which begin (apart from leading whitespace) with a '#' character.  Comments cannot be initiated part way through a line: e.g., a line 'foo: bar # baz' gives the 'foo' configuration variable the literal value 'bar # baz'.  Non-comment lines consist of a configuration variable name followed by optional whitespace, a separator of ':' or '=', more optional whitespace, and finally the value of that variable in string form.
+
+        @param fp: The file object to read.
+        @param lazy: Flag determining whether to put off converting values until they're first needed (see Value.setFromStringLazily and validateAll).
+        """
+        with Transaction():
+            for (lineno, name, value) in self._parse(fp):
+                variable = self._resolve(lineno, name)
+                if lazy:
+                    variable.setFromStringLazily(value, FILES)
+                else:
+                    variable.setFromString(value, FILES)
+
+    def _parse(self, fp):
+        """Generates a (lineno, name, value string) triple for each line of the given
+        file object which sets one of this group's variables."""
+        return self._parseLines(enumerate(fp, 1))
+
+    def _parseLines(self, lines):
+        """Generates the triples _parse does from the given (lineno, line) pairs.
+        Non-strict groups skip the lines which don't begin with their name before
+        stripping or splitting them, so other groups' lines cost next to nothing."""
+        strict = self._strict
+        prefix = self._name
+        split = self._sepRe.split
+        for (lineno, line) in lines:
+            if not strict and not line.lstrip().startswith(prefix):
+                continue # Just ignore other names.
             line = line.strip()
             if not line or line.startswith('#'):
                 continue
             try:
-                (name, value) = self._sepRe.split(line, 1)
+                (name, value) = split(line, 1)
             except ValueError:
                 raise MissingName(lineno)
             value = value.strip()
-            parts = name.split('.')
-            if parts.pop(0) != self._name:
-                if not self._strict:
-                    continue # Just ignore other names.
+            if name.split('.', 1)[0] != prefix:
+                if not strict:
+                    continue # A longer name beginning with this one.
                 raise UnregisteredName(lineno, name)
-            group = self
-            for part in parts:
-                try:
-                    group = group.get(part)
-                except KeyError:
-                    if not self._strict:
-                        group = IgnoreValue()
-                    raise UnregisteredName(lineno, name)
-            if not group.expectsValue():
-                raise InvalidSyntax(lineno, '%s expects no value' % name)
-            group.setFromString(value)
-
-    def read(self, filename):
-        """Calls readfp with a file object opened with the given name."""
+            yield (lineno, name, value)
+
+    def _scanMapped(self, m):
+        """Generates (lineno, line) pairs for the lines of the given mmap which begin,
+        apart from leading whitespace, with this group's name.  Lines are found by
+        searching for the name, so the others are never looked at in Python."""
+        prefix = self._name
+        size = len(m)
+        lineno = 1
+        counted = 0 # The offset of the line lineno is the number of.
+        pos = m.find(prefix)
+        while pos >= 0:
+            start = m.rfind('\n', 0, pos) + 1
+            end = m.find('\n', pos)
+            if end < 0:
+                end = size
+            if start == pos or not m[start:pos].strip():
+                lineno += m[counted:start].count('\n')
+                counted = start
+                yield (lineno, m[start:end])
+            pos = m.find(prefix, end)
+
+    def _parseFile(self, filename):
+        """Returns a list of the triples _parse generates for the file with the given
+        name.  Non-strict groups map the file into memory and scan it for their name
+        (see _scanMapped) rather than reading it line by line."""
         fp = open(filename)
         try:
-            self.readfp(fp)
+            if not self._strict:
+                try:
+                    m = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+                except (ValueError, EnvironmentError):
+                    pass # Empty files, and those which can't be mapped.
+                else:
+                    try:
+                        return list(self._parseLines(self._scanMapped(m)))
+                    finally:
+                        m.close()
+            return list(self._parse(fp))
         finally:
             fp.close()
 
-    def readenv(self, environ=None):
+    def _resolve(self, lineno, name):
+        try:
+            group = self.lookup(name)
+        except KeyError:
+            if not self._strict:
+                return IgnoreValue()
+            raise UnregisteredName(lineno, name)
+        if not group.expectsValue():
+            raise InvalidSyntax(lineno, '%s expects no value' % name)
+        return group
+
+    def read(self, filename, lazy=False):
+        """Reads the file with the given name like readfp, and remembers the values read
+        from it for reload.  If this group has been published (see publish), it's
+        published again afterwards, unless the file is read lazily: publishing converts
+        every value, so a lazily read group must be published explicitly."""
+        settings = self._parseFile(filename)
+        with Transaction():
+            for (lineno, name, value) in settings:
+                variable = self._resolve(lineno, name)
+                if lazy:
+                    variable.setFromStringLazily(value, FILES)
+                else:
+                    variable.setFromString(value, FILES)
+        self._remember(filename, settings)
+        if self._published is not None and not lazy:
+            self.publish()
+
+    def readfpSteps(self, fp, lines=1000):
+        """Returns an iterator which reads the given file object like readfp, one step
+        of at most the given number of lines per iteration.  Driving it from an event
+        loop (Twisted's cooperate, for instance) lets the loop run other work between
+        steps, so a large file never stalls it for long.
+
+        @param fp: The file object to read.
+        @param lines: The greatest number of lines to read and set in one step.
+        """
+        parse = self._parse(fp)
+        while True:
+            settings = list(islice(parse, lines))
+            if not settings:
+                break
+            with Transaction():
+                for (lineno, name, value) in settings:
+                    self._resolve(lineno, name).setFromString(value, FILES)
+            yield None
+
+    def readSteps(self, filenames, lines=1000):
+        """Returns an iterator which reads the files with the given names like read(), one
+        step of at most the given number of lines per iteration (see readfpSteps).  The
+        files are parsed concurrently, each step parsing a batch of lines from the next
+        file in turn, but no value is set until all of them have been parsed; values
+        are then set in steps, file by file in the order given, so the result is the
+        same as reading them one after another.
+
+        @param filenames: The names of the files to read.
+        @param lines: The greatest number of lines to parse or set in one step.
+        """
+        fps = [open(filename) for filename in filenames]
+        try:
+            parses = [self._parse(fp) for fp in fps]
+            settings = [[] for _ in fps]
+            pending = range(len(fps))
+            while pending:
+                for i in list(pending):
+                    batch = list(islice(parses[i], lines))
+                    if batch:
+                        settings[i].extend(batch)
+                    else:
+                        pending.remove(i)
+                    yield None
+        finally:
+            for fp in fps:
+                fp.close()
+        for (filename, fileSettings) in izip(filenames, settings):
+            remembered = {}
+            for start in xrange(0, len(fileSettings), lines):
+                with Transaction():
+                    for (lineno, name, value) in fileSettings[start:start+lines]:
+                        self._resolve(lineno, name).setFromString(value, FILES)
+                        remembered[name] = value
+                yield None
+            self._remember(filename, remembered)
+        if self._published is not None:
+            self.publish()
+
+    def readDirectory(self, path, pattern='*.conf', workers=1):
+        """Reads every file in the given directory whose name matches the given pattern,
+        in sorted order, so that a value set in a later file overrides the same value
+        set in an earlier one.  Files are parsed and their values converted by a pool
+        of worker threads, but values are only set, file by file, once every file has
+        been converted; if any file has an error, nothing is set and the InvalidSyntax
+        for the first such file is raised, naming the file.  Returns the names of the
+        files read.
+
+        @param path: The directory to read.
+        @param pattern: The fnmatch pattern the names of the files to read must match.
+        @param workers: The number of threads to parse and convert files with.
+        """
+        filenames = [os.path.join(path, name)
+                     for name in sorted(fnmatch.filter(os.listdir(path), pattern))]
+        if workers > 1:
+            pool = ThreadPool(workers)
+            try:
+                results = pool.map(self._convertFile, filenames)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = map(self._convertFile, filenames)
+        for result in results:
+            if isinstance(result, InvalidSyntax):
+                raise result
+        with Transaction():
+            for (filename, (settings, converted)) in izip(filenames, results):
+                for (variable, value) in converted:
+                    variable.set(value, FILES)
+                self._remember(filename, settings)
+        if self._published is not None:
+            self.publish()
+        return filenames
+
+    def _convertFile(self, filename):
+        """Returns the settings parsed from the given file and a list of (variable,
+        converted value) pairs, or the InvalidSyntax raised trying."""
+        try:
+            settings = self._parseFile(filename)
+            converted = []
+            for (lineno, name, value) in settings:
+                variable = self._resolve(lineno, name)
+                if isinstance(variable, IgnoreValue):
+                    continue
+                try:
+                    converted.append((variable, variable.fromString(value)))
+                except ValueError, e:
+                    raise InvalidValue(lineno, name, e)
+            return (settings, converted)
+        except InvalidSyntax, e:
+            e.filename = filename
+            return e
+
+    def _remember(self, filename, settings, reloaded=False):
+        if self._loaded is None:
+            self._loaded = OrderedDict()
+        if not isinstance(settings, dict):
+            settings = dict((name, value) for (_, name, value) in settings)
+        if not reloaded:
+            # Read again, so it now comes after the files read before it.
+            self._loaded.pop(filename, None)
+        self._loaded[filename] = settings
+
+    def _fileValue(self, name, filename=None, settings=None):
+        """Returns the value string given for the named variable by the last remembered
+        file setting it, or None if none does.  If given, the settings stand in for
+        those remembered for the given file."""
+        value = None
+        loaded = self._loaded or {}
+        for (other, otherSettings) in loaded.iteritems():
+            if other == filename:
+                otherSettings = settings
+            value = otherSettings.get(name, value)
+        if filename is not None and filename not in loaded:
+            value = settings.get(name, value)
+        return value
+
+    def reload(self, filename):
+        """Reads the file with the given name again, but only sets the variables whose
+        value strings differ from those read from the file the last time it was read or
+        reloaded.  Files share the FILES layer, so a variable takes its value from the
+        last file read which sets it, whichever file is reloaded: reloading an earlier
+        file doesn't override a later one, and a variable the reloaded file no longer
+        mentions falls back to the value another file gives it, or if none does, to
+        any set in other layers (see set).  All the changed values are converted before
+        any is set, so a file with an invalid value leaves the configuration untouched.
+        Returns a Changes of the names involved.
+
+        @param filename: The name of the file to reload.
+        """
+        settings = self._parseFile(filename)
+        previous = {}
+        if self._loaded is not None:
+            previous = self._loaded.get(filename, {})
+        changes = Changes([], [], [])
+        updates = {}
+        latest = {} # name -> the line last setting it, which wins.
+        for (lineno, name, value) in settings:
+            latest[name] = lineno
+        current = dict((name, value) for (_, name, value) in settings)
+        def update(variable, name):
+            value = self._fileValue(name, filename, current)
+            if value != self._fileValue(name):
+                if value is not None:
+                    value = variable.fromString(value)
+                updates[name] = (variable, value)
+        for (lineno, name, value) in settings:
+            if latest[name] != lineno or previous.get(name) == value:
+                continue
+            variable = self._resolve(lineno, name)
+            if isinstance(variable, IgnoreValue):
+                continue
+            update(variable, name)
+            if name in previous:
+                changes.changed.append(name)
+            else:
+                changes.added.append(name)
+        for name in previous:
+            if name in current:
+                continue
+            try:
+                update(self.lookup(name), name)
+            except KeyError:
+                continue
+            changes.removed.append(name)
+        with Transaction():
+            for (variable, value) in updates.itervalues():
+                variable.set(value, FILES)
+        self._remember(filename, current, reloaded=True)
+        if self._published is not None:
+            # In full, since defaults and values set since the last publish may have
+            # changed too; unchanged parts are still shared with the last copy.
+            self.publish()
+        return changes
+
+    def subscribe(self, callback):
+        """Calls the given callback at the end of every transaction (see Transaction) which
+        changed the value of this variable or any of this group's variables, with a
+        list of (name, old value, new value) triples for the changed variables, sorted
+        by name.  Changes through defaults count: the variables read while evaluating
+        a default given by hieropt.parent or a callable are recorded, so that changing
+        any of them re-evaluates it.  Each subscriber is called once per transaction,
+        however many values changed.  Values are compared with ==, so setting a value
+        to what it already was changes nothing.  If a callback raises, the remaining
+        subscribers are still called, and then the first exception is re-raised from
+        the set() or transaction which made the change; the changes stay made.  Values
+        set lazily (see readfp) aren't converted to be compared: until read, they're
+        compared and reported as the strings given for them.
+
+        @param callback: A function taking a list of changes.
+        """
+        _lock.acquire()
+        try:
+            _subscribers.setdefault(self, []).append(callback)
+            for (_, variable) in self.variables():
+                if isinstance(variable, Value) and variable not in _watched:
+                    _watched[variable] = _evaluate(variable)
+        finally:
+            _lock.release()
+
+    def unsubscribe(self, callback):
+        """Stops calling the given callback, which was subscribed to this group."""
+        _lock.acquire()
+        try:
+            callbacks = _subscribers[self]
+            callbacks.remove(callback)
+            if not callbacks:
+                del _subscribers[self]
+                for (_, variable) in self.variables():
+                    if not _subscribed(variable):
+                        _unwatch(variable)
+        finally:
+            _lock.release()
+
+    def fork(self):
+        """Returns a Fork of this group: a view of it whose values can be set without
+        setting the group's.  Making a fork copies nothing, and each value set through
+        it costs one dict entry, so forks suit per-tenant or per-request configuration
+        which differs from a shared base in a few values."""
+        return Fork(self, {})
+
+    def publish(self, names=None):
+        """Publishes a Frozen copy of the current values of this group and its children, which published() returns until the next publish.  Readers which take their values from a published copy need no locking and always see a consistent configuration, even while another thread changes this group: each new copy is made visible with a single assignment.  Parts of a copy whose values are unchanged are shared with the previous copy.  Once a group has been published, read() and reload() publish it again after they change it.  Returns the new copy.
+
+        @param names: The names (as given to lookup) of the only variables which may have changed since the last publish.  If not given, the whole group is compared with the last copy.  Defaults given by callables are only evaluated again for the named variables and their descendants.
+        """
+        previous = self._published
+        if previous is None or names is None or self._name in names:
+            version = _freeze(self, previous)
+        else:
+            # Frozen nodes copied during this publish aren't visible to readers yet,
+            # so they can be changed in place for the rest of the names.
+            version = previous._copy()
+            fresh = set([id(version)])
+            for name in names:
+                parts = name.split('.')[1:]
+                live = self
+                frozen = version
+                for (i, part) in enumerate(parts):
+                    live = live.get(part)
+                    child = frozen._children.get(part)
+                    if child is None or i == len(parts) - 1:
+                        frozen._children[part] = _freeze(live, child)
+                        break
+                    if id(child) not in fresh:
+                        child = child._copy()
+                        fresh.add(id(child))
+                        frozen._children[part] = child
+                    frozen = child
+        self._published = version
+        return version
+
+    def published(self):
+        """Returns the Frozen copy of this group made by the last publish, or None if the
+        group has never been published."""
+        return self._published
+
+    _snapshotMagic = 'hieropt snapshot 2\n'
+    def dumpSnapshot(self, filename, sources=()):
+        """Writes the values of this group's variables read from files to the given file, in a binary form which loadSnapshot can apply without parsing anything.  The snapshot also records the size, modification time, and a hash of each of the given source files, so loadSnapshot can tell when it's out of date, and the value strings read from each of them, so that they can be reload()ed after the snapshot is loaded just as if they had been read.  Values are stored with marshal when possible, and pickled otherwise.
+
+        @param filename: The name of the snapshot file to write.  It is written under a temporary name and renamed into place, so readers never see a partial snapshot.
+        @param sources: The names of the configuration files the snapshot stands in for, usually those just given to read().
+        """
+        (names, values, pickled) = self._snapshotValues()
+        loaded = self._loaded or {}
+        remembered = [loaded.get(source) for source in sources]
+        sources = [fingerprint(source) for source in sources]
+        tmp = '%s.%s.tmp' % (filename, os.getpid())
+        fp = open(tmp, 'wb')
+        try:
+            fp.write(self._snapshotMagic)
+            marshal.dump((sources, remembered, names, values, pickled), fp, 2)
+        finally:
+            fp.close()
+        os.rename(tmp, filename)
+
+    def loadSnapshot(self, filename):
+        """Sets the variables of this group from a snapshot written by dumpSnapshot, if the snapshot exists and its source files haven't changed since it was written.  Returns whether the snapshot was loaded; if not, the caller should read() the source files instead.  Loading a snapshot is equivalent to reading its source files, provided the snapshot was dumped right after they were read.
+
+        @param filename: The name of the snapshot file.
+        """
+        try:
+            fp = open(filename, 'rb')
+        except IOError:
+            return False
+        try:
+            if fp.read(len(self._snapshotMagic)) != self._snapshotMagic:
+                return False
+            m = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                (sources, remembered, names, values, pickled) = \
+                          marshal.loads(buffer(m, len(self._snapshotMagic)))
+            except (ValueError, EOFError, TypeError):
+                return False
+            finally:
+                m.close()
+        finally:
+            fp.close()
+        for source in sources:
+            if not unchanged(*source):
+                return False
+        if not self._loadSnapshotValues(names, values, pickled):
+            return False
+        for (source, settings) in izip(sources, remembered):
+            if settings is not None:
+                self._remember(source[0], settings)
+        return True
+
+    def _snapshotValues(self):
+        """Returns the names and values of this group's variables read from files, and
+        the indexes of the values which had to be pickled because marshal can't store
+        them; this is what snapshots (and hieropt.shared segments) hold."""
+        names = []
+        values = []
+        pickled = []
+        for (name, variable) in self.variables():
+            if isinstance(variable, Placeholder):
+                continue # Never set, so it has no layers.
+            value = variable.layerValue(FILES)
+            if value is None:
+                continue
+            try:
+                if type(value) not in _marshalled:
+                    raise ValueError # Such as arrays, which marshal writes as strings.
+                marshal.dumps(value)
+            except ValueError:
+                pickled.append(len(values))
+                value = cPickle.dumps(value, 2)
+            names.append(name)
+            values.append(value)
+        return (names, values, pickled)
+
+    def _loadSnapshotValues(self, names, values, pickled):
+        """Sets the variables with the given names to the given values, as returned by
+        _snapshotValues, in one transaction.  Returns False, setting nothing, if any of
+        the names isn't in the tree."""
+        try:
+            variables = [self.lookup(name) for name in names]
+        except KeyError:
+            return False # The tree no longer has a variable in the snapshot.
+        for i in pickled:
+            values[i] = cPickle.loads(values[i])
+        with Transaction():
+            for (variable, value) in izip(variables, values):
+                variable.set(value, FILES)
+        return True
+
+    def readenv(self, environ=None, lazy=False):
         """Reads the given environment dictionary, setting the state of this configuration group and its children appropriately.  Unrecognized env variable names are ignored.  Environment variables are expected to be capitalized, parts separated by underscores.  For instance, if you would access the configuration variable via 'foo.bar.baz' in Python, the environment variable expected would be FOO_BAR_BAZ.
 
+        Only the environment variables beginning with this group's name are looked at, through an index of environment variable names kept until the shape of the tree changes, so the cost of reading the environment depends on its size rather than the size of the tree.
+
         @param environ: The environment dictionary.  Defaults to os.environ.
         @type environ: dict
+        @param lazy: Flag determining whether to put off converting values until they're first needed, as with readfp.
         """
         if environ is None:
             environ = os.environ
-        for (name, variable) in self:
-            if not variable.expectsValue():
-                continue
-            envName = name.replace('.', '_').upper()
-            try:
-                variable.setFromString(environ[envName])
-            except KeyError:
-                continue
-            except ValueError, e:
-                raise ValueError('Invalid environment variable %s: %s' % (envName, e))
+        if lazy:
+            with Transaction():
+                for (envName, variable) in self._envSettings(environ):
+                    variable.setFromStringLazily(environ[envName], ENV)
+        else:
+            self._readenv(self._envSettings(environ), environ)
+
+    def validateAll(self):
+        """Converts the values of all the variables of this group set lazily (see readfp)
+        but not yet converted, in every layer, and returns a list of (name, exception)
+        pairs for all those which couldn't be converted, highest layer first.  An empty
+        list means every value is valid."""
+        errors = []
+        for (name, variable) in self.variables():
+            if isinstance(variable, Value) and variable._layers is not None:
+                layers = variable._layers
+                if not isinstance(layers, dict):
+                    layers = {layers: (variable._value, variable._raw)}
+                for (layer, (_, raw)) in sorted(layers.items(), reverse=True):
+                    if raw is not None:
+                        try:
+                            variable.layerValue(layer)
+                        except ValueError, e:
+                            errors.append((name, e))
+        return errors
+
+    def readenvSteps(self, environ=None, variables=1000):
+        """Returns an iterator which reads the given environment dictionary like readenv,
+        one step of at most the given number of variables per iteration (see
+        readfpSteps).
+
+        @param environ: The environment dictionary.  Defaults to os.environ.
+        @param variables: The greatest number of variables to set in one step.
+        """
+        if environ is None:
+            environ = os.environ
+        settings = self._envSettings(environ)
+        for start in xrange(0, len(settings), variables):
+            self._readenv(settings[start:start+variables], environ)
+            yield None
+
+    def _readenv(self, settings, environ):
+        with Transaction():
+            for (envName, variable) in settings:
+                try:
+                    variable.setFromString(environ[envName], ENV)
+                except ValueError, e:
+                    raise ValueError('Invalid environment variable %s: %s' % (envName, e))
+
+    def _envIndex(self):
+        """Returns a cached dict mapping environment variable names to lists of the
+        variables which read them; the lists only have more than one variable when
+        names collide."""
+        cache = self._shapeCache
+        if cache is None:
+            cache = self._shapeCache = {}
+        try:
+            return cache['env']
+        except KeyError:
+            index = {}
+            for (name, variable) in self.variables():
+                index.setdefault(name.replace('.', '_').upper(), []).append(variable)
+            cache['env'] = index
+            return index
+
+    def _envSettings(self, environ):
+        """Returns a list of (environment variable name, variable) pairs for the
+        variables of this group set in the given environment."""
+        index = self._envIndex()
+        if len(environ) < len(index):
+            envName = self._name.upper()
+            prefix = envName + '_'
+            envNames = [name for name in environ
+                        if (name.startswith(prefix) or name == envName) and name in index]
+        else:
+            envNames = [name for name in index if name in environ]
+        envNames.sort()
+        return [(name, variable) for name in envNames for variable in index[name]]
+
+    def envCollisions(self):
+        """Returns a dict mapping each environment variable name which would be read by
+        more than one of this group's variables (e.g., by both foo.bar_baz and
+        foo.bar.baz) to the names of those variables."""
+        offset = len(self._fullname()) - len(self._name)
+        return dict((envName, [variable._fullname()[offset:] for variable in variables])
+                    for (envName, variables) in self._envIndex().iteritems()
+                    if len(variables) > 1)
         
     def __iter__(self):
         """Generates a series of (fullname, configuration variable) pairs for this Group
-        and its children."""
-        yield (self._name, self)
-        for child in self.children():
-            for (childname, grandchild) in child:
-                yield (self._fullname(self._name, childname), grandchild)
+        and its children.  The pairs come from a list which is kept until the shape
+        of the tree beneath this group changes."""
+        return iter(self._flatten())
 
     def toOptionParser(self, parser=None, **kwargs):
         """Modifies or produces an optparse.OptionParser which will set the appropriate variables in this configuration tree when certain options are given.  Options are converted to lowercase and separated by dashes, in accordance with the common practice for long options in *nix.  For instance, if you would access the configuration variable via 'foo.bar.baz' in Python, the command line option associated with that variable would be --foo-bar-baz."""
         if parser is None:
             parser = OptionParser(**kwargs)
-        for (name, variable) in self:
-            if not variable.expectsValue():
-                continue
+        for (name, variable) in self.variables():
             optionName = name.replace('.', '-').lower()
             parser.add_option('', '--' + optionName, action="callback",
                               type="string", callback=OptparseCallback,
                               metavar=variable.type().upper(), help=variable._comment,
                               callback_args=(variable,))
         return parser
+
+    def parseArgs(self, args=None, **kwargs):
+        """Sets the variables in this configuration tree from the given command line arguments, accepting the same options as the parser made by toOptionParser, and returns the remaining (positional) arguments.  Options are resolved through an index of option names, and may be abbreviated to any unique prefix, as with optparse; the full OptionParser is only built when it's needed, to print help (for -h or --help) or to report an error.
+
+        @param args: The command line arguments.  Defaults to sys.argv[1:].
+        @param kwargs: Keyword arguments for the OptionParser, if one is built.
+        """
+        if args is None:
+            args = sys.argv[1:]
+        (options, names) = self._optionIndex()
+        settings = []
+        positional = []
+        i = 0
+        while i < len(args):
+            arg = args[i]
+            i += 1
+            if arg == '--':
+                positional.extend(args[i:])
+                break
+            elif not arg.startswith('-') or arg == '-':
+                positional.append(arg)
+                continue
+            elif not arg.startswith('--'):
+                return self._fullParse(args, kwargs) # Short options, such as -h.
+            if '=' in arg:
+                (option, value) = arg[2:].split('=', 1)
+            elif i < len(args):
+                (option, value) = (arg[2:], args[i])
+                i += 1
+            else:
+                return self._fullParse(args, kwargs) # Missing value, or --help.
+            if option not in options:
+                # Abbreviated, unless ambiguous or unknown.
+                start = bisect.bisect_left(names, option)
+                matches = names[start:start+2]
+                if len(matches) < 1 or not matches[0].startswith(option) or \
+                   (len(matches) > 1 and matches[1].startswith(option)):
+                    return self._fullParse(args, kwargs)
+                option = matches[0]
+            variable = options.get(option)
+            if variable is None:
+                return self._fullParse(args, kwargs) # --help
+            settings.append((variable, value))
+        try:
+            converted = [(variable, variable.fromString(value))
+                         for (variable, value) in settings]
+        except ValueError:
+            return self._fullParse(args, kwargs) # For optparse's error message.
+        with Transaction():
+            for (variable, value) in converted:
+                variable.set(value, CLI)
+        return positional
+
+    def _fullParse(self, args, kwargs):
+        parser = self.toOptionParser(**kwargs)
+        with Transaction():
+            return parser.parse_args(args)[1]
+
+    def _optionIndex(self):
+        """Returns a cached dict mapping long option names (without the leading dashes)
+        to variables, and a sorted list of the names, including 'help'."""
+        cache = self._shapeCache
+        if cache is None:
+            cache = self._shapeCache = {}
+        try:
+            return cache['options']
+        except KeyError:
+            options = {}
+            for (name, variable) in self.variables():
+                options[name.replace('.', '-').lower()] = variable
+            names = sorted(options)
+            bisect.insort(names, 'help')
+            cache['options'] = (options, names)
+            return cache['options']
                               
-    def children(self):
-        return self._children.values()
+    def children(self, materializedOnly=False):
+        """Returns a list of the children of this group, in the order they were registered.
+
+        @param materializedOnly: Flag determining whether to leave out the placeholders of unset children in flyweight groups.
+        """
+        if self._order is None:
+            return []
+        elif materializedOnly:
+            return [child for child in self._order if not isinstance(child, Placeholder)]
+        else:
+            return list(self._order)
 
     def expectsValue(self):
         return False
@@ -257,26 +1419,136 @@ class Group(object):
 
 parent = object()
 class Value(Group):
-    def __init__(self, name, default=None, **kwargs):
+    __slots__ = ('_value', '_raw', '_layers', '_default', '_memoize', '_memo', '_memoVersion')
+
+    def __init__(self, name, default=None, memoize=False, **kwargs):
+        """
+        @param default: The value returned when no value has been set.  If callable, it is called to produce the default; if hieropt.parent, the value of this variable's parent is used.
+
+        @param memoize: Flag determining whether to cache the default produced by a callable or hieropt.parent.  The cache is dropped whenever any value is set or reset or any tree changes shape, so only memoize defaults which depend on nothing but other configuration variables.
+        """
         Group.__init__(self, name, **kwargs)
         self._value = None
+        self._raw = None # A string set lazily, to be converted when first needed.
+        # The layer _value comes from, if only one is set; otherwise None, or a dict
+        # mapping each layer set to its (value, raw string) pair.
+        self._layers = None
         self._default = default
+        self._memoize = memoize
+        self._memo = None
+        self._memoVersion = None
 
     @property
     def default(self):
+        version = _version
         if callable(self._default):
-            return self._default()
+            default = self._default()
         elif self._default is parent:
-            return self._parent()
+            default = self._parent()
         else:
             return self._default
+        if self._memoize and not (_special and getattr(_local, 'overrides', None)):
+            self._memo = default
+            self._memoVersion = version
+        return default
 
     def __call__(self):
+        if _special:
+            return self._specialCall()
         if self._value is None:
+            if self._raw is not None:
+                return self._convertRaw()
+            if self._memoVersion == _version:
+                return self._memo
             return self.default
         else:
             return self._value
 
+    def _specialCall(self):
+        recording = getattr(_local, 'recording', None)
+        overrides = getattr(_local, 'overrides', None)
+        if recording is not None:
+            recording.add(self)
+        if overrides and self in overrides:
+            return overrides[self]
+        elif self._value is not None:
+            return self._value
+        elif self._raw is not None:
+            return self._convertRaw()
+        elif recording is None and not overrides and self._memoVersion == _version:
+            return self._memo
+        else:
+            # Evaluated, so that it sees any overrides and records what it reads.
+            return self.default
+
+    def _convertRaw(self):
+        value = self.fromString(self._raw)
+        self._value = value
+        self._raw = None
+        layers = self._layers
+        if isinstance(layers, dict):
+            layers[max(layers)] = (value, None)
+        return value
+
+    def _setLayer(self, layer, value, raw):
+        wasDefault = self.isDefault()
+        layers = self._layers
+        if layers is None or layers == layer:
+            # Only this layer is set, so its value is kept inline, without a dict.
+            if value is None and raw is None:
+                self._layers = None
+            else:
+                self._layers = layer
+            (self._value, self._raw) = (value, raw)
+        else:
+            if not isinstance(layers, dict):
+                layers = {layers: (self._value, self._raw)}
+            if value is None and raw is None:
+                layers.pop(layer, None)
+            else:
+                layers[layer] = (value, raw)
+            if len(layers) == 1:
+                ((self._layers, (self._value, self._raw)),) = layers.items()
+            else:
+                self._layers = layers
+                (self._value, self._raw) = layers[max(layers)]
+        if wasDefault != self.isDefault():
+            self._countDirty(wasDefault and 1 or -1)
+        _changed()
+        if _subscribers:
+            _noteChange(self)
+
+    def layer(self):
+        """Returns the layer this variable's value comes from: DEFAULTS, FILES, ENV,
+        CLI, or RUNTIME."""
+        layers = self._layers
+        if layers is None:
+            return DEFAULTS
+        elif isinstance(layers, dict):
+            return max(layers)
+        else:
+            return layers
+
+    def layerValue(self, layer):
+        """Returns the value set in the given layer, or None if none is."""
+        layers = self._layers
+        if not isinstance(layers, dict):
+            if layers is None or layers != layer:
+                return None
+            elif self._raw is not None:
+                return self._convertRaw()
+            else:
+                return self._value
+        elif layer not in layers:
+            return None
+        (value, raw) = layers[layer]
+        if raw is not None:
+            value = self.fromString(raw)
+            layers[layer] = (value, None)
+            if layer == max(layers):
+                (self._value, self._raw) = (value, None)
+        return value
+
     @classmethod
     def type(cls):
         if cls is Value:
@@ -284,11 +1556,27 @@ class Value(Group):
         else:
             return cls.__name__.lower()
 
-    def set(self, v):
-        self._value = v
+    def set(self, v, layer=RUNTIME):
+        """Sets the value of this variable in the given layer.  The variable's value is
+        the one set in its highest layer (RUNTIME, then CLI, ENV, and FILES), so setting
+        a value in a lower layer than another value is set in changes nothing until
+        that value is removed.  Setting None removes the value set in the layer."""
+        self._setLayer(layer, v, None)
 
-    def setFromString(self, s):
-        self.set(self.fromString(s))
+    def _countDirty(self, n):
+        node = self
+        while node is not None:
+            node._dirty += n
+            node = node._parent
+
+    def setFromString(self, s, layer=RUNTIME):
+        self.set(self.fromString(s), layer)
+
+    def setFromStringLazily(self, s, layer=RUNTIME):
+        """Sets this variable to the given string, which is only converted (by fromString)
+        when the variable's value is first needed.  Invalid strings aren't reported
+        until then; see Group.validateAll."""
+        self._setLayer(layer, None, s)
 
     def fromString(self, s):
         return s
@@ -299,36 +1587,58 @@ class Value(Group):
     def __str__(self):
         return self.toString(self())
 
-    def writefp(self, fp, annotate=True, parentName=None):
+    def _write(self, out, annotate, parentName, materializedOnly, onlyChanged):
+        if onlyChanged and not self._dirty:
+            return
         myname = self._fullname(parentName)
+        if not onlyChanged or not self.isDefault():
+            self._writeValue(out, myname, annotate)
+        if parentName is None:
+            myname = None
+        for child in self.children(materializedOnly):
+            child._write(out, annotate, myname, materializedOnly, onlyChanged)
+
+    def _writeValue(self, out, name, annotate):
         if self._comment is not None and annotate:
-            writeComment(fp, self._comment)
-        if self._value is None:
-            fp.write('# ') # Document the default value, but comment it out.
-        if self() is None:
+            out.append(commentLines(self._comment))
+        # Values overridden in this thread (see Group.override) are written as set.
+        overridden = _special and self in (getattr(_local, 'overrides', None) or ())
+        if self.isDefault() and not overridden:
+            out.append('# ') # Document the default value, but comment it out.
+        if self._raw is not None and not overridden:
+            stringValue = self._raw
+        elif self() is None:
             stringValue = '(no default)'
         else:
             stringValue = str(self)
-        fp.write('%s: %s\n' % (myname, stringValue))
+        out.append('%s: %s\n' % (name, stringValue))
         if annotate:
-            fp.write('\n') # Extra newline makes comments more easily distinguishable.
-        for child in self.children():
-            child.writefp(fp, annotate=annotate, parentName=myname)
+            out.append('\n') # Extra newline makes comments more easily distinguishable.
 
     def expectsValue(self):
         return True
 
     def isSet(self):
-        return self._value is not None or self.default is not None
+        return not self.isDefault() or self.default is not None
 
     def isDefault(self):
-        return self._value is None
+        return self._value is None and self._raw is None
 
     def reset(self):
+        """Removes the values set in every layer, so the variable has its default."""
+        if not self.isDefault():
+            self._countDirty(-1)
         self._value = None
+        self._raw = None
+        self._layers = None
+        _changed()
+        if _subscribers:
+            _noteChange(self)
     
 
 class Bool(Value):
+    __slots__ = ()
+
     def fromString(self, s):
         if s.lower() in ['true', 'on', '1', 'yes']:
             return True
@@ -339,6 +1649,8 @@ class Bool(Value):
 
 
 class Int(Value):
+    __slots__ = ()
+
     def fromString(self, s):
         if s.startswith('0x'):
             return int(s[2:], 16)
@@ -349,4 +1661,325 @@ class Int(Value):
 
 
 class Float(Value):
+    __slots__ = ()
     fromString = float
+
+
+def _intFromString(s):
+    return int(s, 0) # Base 0 accepts the same hexadecimal and octal forms as Int.
+
+_bools = dict([(s, True) for s in ['true', 'on', '1', 'yes']] +
+              [(s, False) for s in ['false', 'off', '0', 'no']])
+def _boolFromString(s):
+    try:
+        return _bools[s.lower()]
+    except KeyError:
+        raise ValueError('%r cannot be converted to bool' % s)
+
+def _boolToString(b):
+    return str(bool(b))
+
+class ArrayValue(Value):
+    """Variables holding a sequence of numbers, given in configuration files as items
+    separated by commas and/or whitespace.  Values (and defaults given as sequences)
+    are stored compactly in an array.array of the class's typecode rather than as a
+    list of Python objects.  Subclasses change typecode, itemFromString, which
+    converts one item from a string, and itemToString, its inverse; by default items
+    are floats."""
+    __slots__ = ()
+    typecode = 'd'
+    itemFromString = float
+    itemToString = repr
+
+    def __init__(self, name, default=None, **kwargs):
+        if default is not None and not callable(default) and default is not parent:
+            default = array.array(self.typecode, default)
+        Value.__init__(self, name, default, **kwargs)
+
+    def fromString(self, s):
+        try:
+            # str.split is much faster than splitting on a regular expression.
+            items = map(self.itemFromString, s.replace(',', ' ').split())
+            v = array.array(self.typecode)
+            v.fromlist(items)
+            return v
+        except OverflowError, e:
+            raise ValueError('%r cannot be converted to %s: %s' % (s, self.__class__.__name__, e))
+
+    def toString(self, v):
+        return ', '.join(map(self.itemToString, v))
+
+    def _array(self):
+        v = self()
+        if v is None:
+            raise ValueError('%s has no value.' % self._fullname())
+        if not isinstance(v, array.array):
+            v = array.array(self.typecode, v) # From a callable default.
+        return v
+
+    def view(self):
+        """Returns a read-only buffer over the memory of this variable's array, without copying it."""
+        return buffer(self._array())
+
+    def toNumpy(self):
+        """Returns a NumPy array sharing this variable's memory.  Requires NumPy."""
+        import numpy
+        v = self._array()
+        return numpy.frombuffer(v, dtype=numpy.dtype(v.typecode))
+
+
+class IntList(ArrayValue):
+    __slots__ = ()
+    typecode = 'l'
+    itemFromString = staticmethod(_intFromString)
+    itemToString = str
+
+
+class FloatList(ArrayValue):
+    __slots__ = ()
+
+
+class BoolList(ArrayValue):
+    __slots__ = ()
+    typecode = 'b'
+    itemFromString = staticmethod(_boolFromString)
+    itemToString = staticmethod(_boolToString)
+
+
+class Placeholder(object):
+    """Stands in for an unset child of a flyweight group (see Group.__init__).  Reads
+    are answered by the group's flyweight; anything which could change the child
+    replaces the placeholder with a real child, created by the group's Child, and
+    is passed on to that."""
+    __slots__ = ('_name', '_parent', '_cachedFullname')
+    _order = None
+    _index = None
+    _dirty = 0
+
+    # Methods which only read, and so can be answered by the flyweight.
+    _reads = frozenset(['default', 'expectsValue', 'isSet', 'isDefault', 'type',
+                        'fromString', 'toString'])
+
+    def __init__(self, name):
+        self._name = name
+        self._parent = None
+        self._cachedFullname = None
+
+    _fullname = Group.__dict__['_fullname']
+    _subtree = Group.__dict__['_subtree']
+
+    @property
+    def _comment(self):
+        return self._target()._comment # For toOptionParser's help.
+    children = Group.__dict__['children']
+
+    def _target(self):
+        child = self._parent._children[self._name]
+        if child is self:
+            return self._parent._flyweight
+        else:
+            return child # Materialized since this placeholder was handed out.
+
+    def _materialize(self):
+        child = self._parent._children[self._name]
+        if child is self:
+            _lock.acquire()
+            try:
+                child = self._parent._children[self._name]
+                if child is self:
+                    child = self._parent.register(self._parent._Child(self._name))
+            finally:
+                _lock.release()
+        return child
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        elif name in self._reads:
+            return getattr(self._target(), name)
+        else:
+            return getattr(self._materialize(), name)
+
+    def __call__(self):
+        return self._target()()
+
+    def __str__(self):
+        return str(self._target())
+
+    def __iter__(self):
+        return iter([(self._name, self)])
+
+    writefp = Group.__dict__['writefp']
+
+    def _write(self, out, annotate, parentName, materializedOnly, onlyChanged):
+        target = self._target()
+        if target is not self._parent._flyweight:
+            target._write(out, annotate, parentName, materializedOnly, onlyChanged)
+        elif not (materializedOnly or onlyChanged):
+            target._writeValue(out, self._fullname(parentName), annotate)
+
+
+class Frozen(object):
+    """An immutable copy of the values of a configuration group and its children, made by Group.publish.  Frozen groups are read like the groups they were copied from: frozen.foo.bar() returns the value foo.bar had when the copy was published.  Copies share their unchanged parts with each other, so they must never be modified."""
+    __slots__ = ('_name', '_value', '_children')
+
+    def __init__(self, name, value, children):
+        self._name = name
+        self._value = value
+        self._children = children
+
+    def _copy(self):
+        return Frozen(self._name, self._value, dict(self._children or ()))
+
+    def get(self, name):
+        if self._children is None:
+            raise KeyError(name)
+        return self._children[name]
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        try:
+            return self.get(name)
+        except KeyError:
+            raise AttributeError(name)
+
+    def __call__(self):
+        if self._value is _noValue:
+            raise GroupExpectsNoValue(self._name)
+        return self._value
+
+    def expectsValue(self):
+        return self._value is not _noValue
+
+    def lookup(self, name):
+        """Returns the frozen copy of the variable with the given dotted name, which
+        begins with this group's own name."""
+        parts = name.split('.')
+        if parts.pop(0) != self._name:
+            raise KeyError(name)
+        node = self
+        for part in parts:
+            node = node.get(part)
+        return node
+
+
+class Fork(object):
+    """A view of a configuration group and its children, made by Group.fork, whose values may be changed without changing the group's.  Forks are read and set like the groups they were made from, but share everything with them except the values set through the fork, which are kept in one dict mapping variables to their values; values not set through a fork are those of the group, whenever they're read.  Setting a value in a fork overrides every layer of the group's value.  The shape of the tree is shared too: children created through a fork (via get or a Child argument) are created in the group itself.
+
+    Forks support attribute access to children, get, lookup, find, iteration, variables, children, calling, set, setFromString, reset, isDefault, expectsValue, type, readfp, writefp, and fork; anything else (readenv or toOptionParser, for instance) must be done through the group itself."""
+    __slots__ = ('_node', '_overrides')
+
+    def __init__(self, node, overrides):
+        self._node = node
+        self._overrides = overrides
+
+    def _variable(self):
+        node = self._node
+        if isinstance(node, Placeholder):
+            node = node._materialize()
+        return node
+
+    def fork(self):
+        """Returns a fork of this fork, starting with a copy of its values."""
+        return Fork(self._node, dict(self._overrides))
+
+    def get(self, name):
+        return Fork(self._node.get(name), self._overrides)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        try:
+            return self.get(name)
+        except KeyError:
+            raise AttributeError(name)
+
+    def lookup(self, name):
+        return Fork(self._node.lookup(name), self._overrides)
+
+    def find(self, pattern):
+        return [(name, Fork(node, self._overrides))
+                for (name, node) in self._node.find(pattern)]
+
+    def __iter__(self):
+        return iter([(name, Fork(node, self._overrides)) for (name, node) in self._node])
+
+    def __call__(self):
+        node = self._node
+        if isinstance(node, Placeholder):
+            node = node._target()
+        if not node.expectsValue():
+            return node() # Raises GroupExpectsNoValue.
+        overrides = self._overrides
+        if node in overrides:
+            return overrides[node]
+        if overrides and (callable(node._default) or node._default is parent) and \
+           node.isDefault():
+            # The default may depend on the values set in this fork.
+            override = Override(overrides)
+            override.__enter__()
+            try:
+                return node()
+            finally:
+                override.__exit__()
+        return node()
+
+    def set(self, v):
+        """Sets the value of this variable in this fork only.  Setting None removes the
+        fork's value, so the group's is used again."""
+        node = self._variable()
+        if not node.expectsValue():
+            raise GroupExpectsNoValue(node._name)
+        if v is None:
+            self._overrides.pop(node, None)
+        else:
+            self._overrides[node] = v
+
+    def setFromString(self, s):
+        self.set(self._node.fromString(s))
+
+    def reset(self):
+        self.set(None)
+
+    def isDefault(self):
+        node = self._node
+        if isinstance(node, Placeholder):
+            node = node._target()
+        return node not in self._overrides and node.isDefault()
+
+    def expectsValue(self):
+        return self._node.expectsValue()
+
+    def type(self):
+        return self._node.type()
+
+    def children(self, materializedOnly=False):
+        return [Fork(child, self._overrides)
+                for child in self._node.children(materializedOnly)]
+
+    def variables(self):
+        return [(name, Fork(variable, self._overrides))
+                for (name, variable) in self._node.variables()]
+
+    def readfp(self, fp):
+        """Reads the given file object like Group.readfp, setting values in this fork."""
+        node = self._variable()
+        overrides = self._overrides
+        for (lineno, name, value) in node._parse(fp):
+            variable = node._resolve(lineno, name)
+            if isinstance(variable, IgnoreValue):
+                continue
+            if isinstance(variable, Placeholder):
+                variable = variable._materialize()
+            overrides[variable] = variable.fromString(value)
+
+    def writefp(self, fp, annotate=True):
+        """Writes the values of this fork like Group.writefp, the values set through
+        the fork included."""
+        override = Override(self._overrides)
+        override.__enter__()
+        try:
+            self._node.writefp(fp, annotate)
+        finally:
+            override.__exit__()
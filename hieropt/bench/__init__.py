@@ -0,0 +1,103 @@
+###
+# Copyright (c) 2009, Juju, Inc.
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer. 
+#     * Redistributions in binary form must reproduce the above
+#       copyright notice, this list of conditions and the following
+#       disclaimer in the documentation and/or other materials provided
+#       with the distribution.
+#     * Neither the name of the author of this software nor the names of
+#       the contributors to the software may be used to endorse or
+#       promote products derived from this software without specific
+#       prior written permission. 
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE. 
+###
+
+
+"""Benchmarks for hieropt.  Each module in this package has a main() function
+printing its results; run them with, e.g., python -m hieropt.bench.lookup.  The
+suite module (run with python -m hieropt.bench) times the main operations together
+and records the results as JSON, to be compared between commits."""
+
+import time
+import random
+
+import hieropt
+
+# A mix of value types in which every type is equally likely.
+MIXED = [(hieropt.Int, 1), (hieropt.Float, 1), (hieropt.Bool, 1), (hieropt.Value, 1)]
+
+def sample(Type, i):
+    """Returns a value of the given type, varying with i."""
+    if issubclass(Type, hieropt.Bool):
+        return i % 2 == 0
+    elif issubclass(Type, hieropt.Int):
+        return i
+    elif issubclass(Type, hieropt.Float):
+        return i / 2.0
+    else:
+        return 'v%s' % i
+
+def makeTree(depth, fanout, name='root', mix=None, seed=0):
+    """Returns a Group with the given depth and fanout.  Every non-root node is a
+    variable, so each level of the tree holds values as well as children.
+
+    @param mix: A list of (type, weight) pairs from which each variable's type is
+    chosen at random; if not given, every variable is an Int.
+    @param seed: The seed for choosing types, so the same arguments give the same tree.
+    """
+    if mix is None:
+        mix = [(hieropt.Int, 1)]
+    choices = []
+    for (Type, weight) in mix:
+        choices.extend([Type] * weight)
+    rng = random.Random(seed)
+    root = hieropt.Group(name)
+    level = [root]
+    for _ in xrange(depth):
+        nextLevel = []
+        for group in level:
+            for i in xrange(fanout):
+                Type = rng.choice(choices)
+                nextLevel.append(group.register(Type('n%s' % i, sample(Type, i))))
+        level = nextLevel
+    return root
+
+def deepest(group):
+    """Returns the full name of the last (and deepest) variable in the group."""
+    name = None
+    for (name, _) in group:
+        pass
+    return name
+
+def timeit(f, repeat=3, number=1000):
+    """Returns the best time, in seconds, of a single call to f."""
+    best = None
+    for _ in xrange(repeat):
+        start = time.time()
+        for _ in xrange(number):
+            f()
+        elapsed = (time.time() - start) / number
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def report(name, seconds):
+    print '%-40s %10.2f us' % (name, seconds * 1e6)
@@ -0,0 +1,63 @@
+###
+# Copyright (c) 2009, Juju, Inc.
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer. 
+#     * Redistributions in binary form must reproduce the above
+#       copyright notice, this list of conditions and the following
+#       disclaimer in the documentation and/or other materials provided
+#       with the distribution.
+#     * Neither the name of the author of this software nor the names of
+#       the contributors to the software may be used to endorse or
+#       promote products derived from this software without specific
+#       prior written permission. 
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE. 
+###
+
+
+"""Times parsing a long list of numbers with FloatList and IntList against splitting
+into a Python list, and compares the memory each representation takes."""
+
+import sys
+import random
+
+import hieropt
+from hieropt.bench import timeit, report
+
+class PlainFloats(hieropt.Value):
+    def fromString(self, s):
+        return [float(x) for x in s.split(',')]
+
+def main():
+    rng = random.Random(0)
+    floats = ', '.join([repr(rng.random()) for _ in xrange(10000)])
+    ints = ', '.join([str(rng.randint(0, 10**6)) for _ in xrange(10000)])
+    plain = PlainFloats('plain')
+    floatList = hieropt.FloatList('floats')
+    intList = hieropt.IntList('ints')
+    report('list of 10000 floats', timeit(lambda: plain.fromString(floats), number=50))
+    report('FloatList of 10000', timeit(lambda: floatList.fromString(floats), number=50))
+    report('IntList of 10000', timeit(lambda: intList.fromString(ints), number=50))
+    values = plain.fromString(floats)
+    print 'list of 10000 floats: %s bytes' % \
+          (sys.getsizeof(values) + sum(map(sys.getsizeof, values)))
+    print 'FloatList of 10000: %s bytes' % sys.getsizeof(floatList.fromString(floats))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+###
+# Copyright (c) 2009, Juju, Inc.
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer. 
+#     * Redistributions in binary form must reproduce the above
+#       copyright notice, this list of conditions and the following
+#       disclaimer in the documentation and/or other materials provided
+#       with the distribution.
+#     * Neither the name of the author of this software nor the names of
+#       the contributors to the software may be used to endorse or
+#       promote products derived from this software without specific
+#       prior written permission. 
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE. 
+###
+
+
+"""Compares command line startup through toOptionParser with parseArgs on a tree of
+10000 options."""
+
+from hieropt.bench import makeTree, timeit, report
+
+def main():
+    root = makeTree(4, 10) # 11110 variables
+    args = ['--root-n1-n2-n3', '4', '--root-n9-n9=5', 'file']
+    report('toOptionParser().parse_args()',
+           timeit(lambda: makeTree(4, 10).toOptionParser().parse_args(args), repeat=1, number=3))
+    report('parseArgs(), new tree',
+           timeit(lambda: makeTree(4, 10).parseArgs(args), repeat=1, number=3))
+    report('tree construction alone', timeit(lambda: makeTree(4, 10), repeat=1, number=3))
+    root.parseArgs(args)
+    report('parseArgs(), index built', timeit(lambda: root.parseArgs(args), number=100))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+###
+# Copyright (c) 2009, Juju, Inc.
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer. 
+#     * Redistributions in binary form must reproduce the above
+#       copyright notice, this list of conditions and the following
+#       disclaimer in the documentation and/or other materials provided
+#       with the distribution.
+#     * Neither the name of the author of this software nor the names of
+#       the contributors to the software may be used to endorse or
+#       promote products derived from this software without specific
+#       prior written permission. 
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE. 
+###
+
+
+"""Compares serial and parallel readDirectory over 1000 fragment files."""
+
+import os
+import time
+import shutil
+import tempfile
+
+import hieropt
+
+def main(fragments=1000, lines=20):
+    directory = tempfile.mkdtemp()
+    try:
+        for i in xrange(fragments):
+            fp = open(os.path.join(directory, '%04d.conf' % i), 'w')
+            for j in xrange(lines):
+                fp.write('conf.f%s.v%s: %s\n' % (i % 100, j, i))
+            fp.close()
+        for workers in [1, 2, 4, 8]:
+            conf = hieropt.Group('conf', Child=lambda name: hieropt.Group(name, Child=hieropt.Int))
+            start = time.time()
+            conf.readDirectory(directory, workers=workers)
+            print '%-40s %10.2f ms' % ('%s fragments, %s workers' % (fragments, workers),
+                                        (time.time() - start) * 1e3)
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+###
+# Copyright (c) 2009, Juju, Inc.
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer. 
+#     * Redistributions in binary form must reproduce the above
+#       copyright notice, this list of conditions and the following
+#       disclaimer in the documentation and/or other materials provided
+#       with the distribution.
+#     * Neither the name of the author of this software nor the names of
+#       the contributors to the software may be used to endorse or
+#       promote products derived from this software without specific
+#       prior written permission. 
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE. 
+###
+
+
+"""Times Group.find on a large tree against matching every name with fnmatch (whose
+'*' also matches dots, so it's only the nearest equivalent pattern)."""
+
+import fnmatch
+
+from hieropt.bench import makeTree, timeit, report
+
+def scan(root, pattern):
+    return [(name, node) for (name, node) in root if fnmatch.fnmatchcase(name, pattern)]
+
+def main():
+    root = makeTree(5, 10) # 111110 nodes
+    for (pattern, fnmatchPattern) in [('root.n1.n2.n3.n4.n5', 'root.n1.n2.n3.n4.n5'),
+                                      ('root.n1.*.n3', 'root.n1.*.n3'),
+                                      ('root.n1.n2.**', 'root.n1.n2.*')]:
+        report('find %s' % pattern, timeit(lambda: root.find(pattern), number=100))
+        report('fnmatch %s' % fnmatchPattern,
+               timeit(lambda: scan(root, fnmatchPattern), number=3))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+###
+# Copyright (c) 2009, Juju, Inc.
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer. 
+#     * Redistributions in binary form must reproduce the above
+#       copyright notice, this list of conditions and the following
+#       disclaimer in the documentation and/or other materials provided
+#       with the distribution.
+#     * Neither the name of the author of this software nor the names of
+#       the contributors to the software may be used to endorse or
+#       promote products derived from this software without specific
+#       prior written permission. 
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE. 
+###
+
+
+"""Times making 10000 forks of a tree of about 5000 nodes, each overriding a few
+values, and compares their memory and read speed with deep copies of the tree."""
+
+import sys
+import copy
+import time
+
+from hieropt.bench import makeTree, timeit, report
+from hieropt.bench.memory import sizeof
+
+OVERRIDES = ['root.n1', 'root.n2.n3', 'root.n4.n5.n6.n7']
+
+def makeForks(root, n):
+    variables = [root.lookup(name) for name in OVERRIDES]
+    forks = []
+    for i in xrange(n):
+        fork = root.fork()
+        for variable in variables:
+            fork.lookup(variable._fullname()).set(i)
+        forks.append(fork)
+    return forks
+
+def main():
+    root = makeTree(4, 8) # 4680 variables
+    start = time.time()
+    forks = makeForks(root, 10000)
+    elapsed = time.time() - start
+    print '%-40s %10.2f s' % ('10000 forks, 3 overrides each', elapsed)
+    fork = forks[-1]
+    print '%-40s %10.1f bytes' % ('per fork', sizeof(fork))
+    start = time.time()
+    copies = [copy.deepcopy(root) for _ in xrange(10)]
+    elapsed = time.time() - start
+    print '%-40s %10.2f s' % ('10000 deep copies (from 10)', elapsed * 1000)
+    print '%-40s %10.1f bytes' % ('per deep copy', sum(sizeof(node) for (_, node) in copies[0]))
+    deep = root.n4.n5.n6.n7
+    forked = fork.n4.n5.n6.n7
+    report('read root.n4.n5.n6.n7', timeit(lambda: deep(), number=10000))
+    report('read through a fork, overridden', timeit(lambda: forked(), number=10000))
+    forked = fork.n4.n5.n6.n6
+    report('read through a fork, shared', timeit(lambda: forked(), number=10000))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+###
+# Copyright (c) 2009, Juju, Inc.
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer. 
+#     * Redistributions in binary form must reproduce the above
+#       copyright notice, this list of conditions and the following
+#       disclaimer in the documentation and/or other materials provided
+#       with the distribution.
+#     * Neither the name of the author of this software nor the names of
+#       the contributors to the software may be used to endorse or
+#       promote products derived from this software without specific
+#       prior written permission. 
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE. 
+###
+
+
+"""Times full traversals of a tree through __iter__ and variables()."""
+
+from hieropt.bench import makeTree, timeit, report
+
+def recursive(group):
+    # The nested-generator traversal __iter__ used to do, for comparison.
+    yield (group._name, group)
+    for child in group.children():
+        for (childname, grandchild) in recursive(child):
+            yield ('%s.%s' % (group._name, childname), grandchild)
+
+def main():
+    for depth in [4, 8]:
+        root = makeTree(depth, 4 if depth == 4 else 2)
+        size = len(list(root))
+        label = 'depth %s, %s nodes' % (depth, size)
+        report('nested generators, ' + label, timeit(lambda: list(recursive(root)), number=10))
+        report('__iter__, ' + label, timeit(lambda: list(root), number=10))
+        report('variables(), ' + label, timeit(lambda: list(root.variables()), number=10))
+
+if __name__ == '__main__':
+    main()
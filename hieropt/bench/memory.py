@@ -0,0 +1,85 @@
+###
+# Copyright (c) 2009, Juju, Inc.
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer. 
+#     * Redistributions in binary form must reproduce the above
+#       copyright notice, this list of conditions and the following
+#       disclaimer in the documentation and/or other materials provided
+#       with the distribution.
+#     * Neither the name of the author of this software nor the names of
+#       the contributors to the software may be used to endorse or
+#       promote products derived from this software without specific
+#       prior written permission. 
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE. 
+###
+
+
+"""Reports the memory used per node of trees built through a Child factory."""
+
+import gc
+import sys
+import types
+
+import hieropt
+
+# Objects shared between nodes rather than owned by any one of them.
+_shared = (type, types.FunctionType, types.BuiltinFunctionType, types.ModuleType)
+
+def sizeof(node):
+    """Returns the number of bytes owned by the given node: the node itself and
+    everything reachable from it which isn't another node or shared by all nodes.
+    Strings are left out, since every representation needs the names."""
+    total = 0
+    seen = set()
+    stack = [node]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        for ref in gc.get_referents(obj):
+            if isinstance(ref, (hieropt.Group, basestring) + _shared) or ref is None:
+                continue
+            stack.append(ref)
+    return total
+
+def perNode(group):
+    nodes = [node for (_, node) in group]
+    return sum(sizeof(node) for node in nodes) / float(len(nodes))
+
+def main():
+    for n in [1000, 100000]:
+        group = hieropt.Group('tenants', Child=hieropt.Int)
+        for i in xrange(n):
+            group.get('t%s' % i).set(i)
+        print '%-40s %10.1f bytes' % ('per node, %s children' % n, perNode(group))
+    # Only one in a hundred of these children ever leaves its default.
+    for flyweight in [False, True]:
+        group = hieropt.Group('tenants', Child=hieropt.Int, flyweight=flyweight)
+        for i in xrange(100000):
+            child = group.get('t%s' % i)
+            if i % 100 == 0:
+                child.set(i)
+        label = 'per node, 1%% set%s' % (flyweight and ', flyweight' or '')
+        print '%-40s %10.1f bytes' % (label, perNode(group))
+
+if __name__ == '__main__':
+    main()
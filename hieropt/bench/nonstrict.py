@@ -0,0 +1,89 @@
+###
+# Copyright (c) 2009, Juju, Inc.
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer. 
+#     * Redistributions in binary form must reproduce the above
+#       copyright notice, this list of conditions and the following
+#       disclaimer in the documentation and/or other materials provided
+#       with the distribution.
+#     * Neither the name of the author of this software nor the names of
+#       the contributors to the software may be used to endorse or
+#       promote products derived from this software without specific
+#       prior written permission. 
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE. 
+###
+
+
+"""Times a non-strict group reading a 1000000 line file of which only 1% of the lines
+are its own, through readfp and through read, which scans the file through mmap;
+and, for comparison, the parse readfp used to do, splitting every line."""
+
+import os
+import shutil
+import tempfile
+
+import hieropt
+from hieropt.bench import timeit, report
+
+def oldParse(group, fp):
+    """The parse readfp did before non-strict groups skipped others' lines."""
+    lineno = 0
+    for line in fp:
+        lineno += 1
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        (name, value) = group._sepRe.split(line, 1)
+        value = value.strip()
+        if name.split('.', 1)[0] != group._name:
+            continue
+        yield (lineno, name, value)
+
+def main():
+    directory = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(directory, 'shared.conf')
+        fp = open(filename, 'w')
+        for i in xrange(1000000):
+            if i % 100 == 0:
+                fp.write('mine.x%s: %s\n' % (i % 1000, i))
+            else:
+                fp.write('other%s.value%s: %s\n' % (i % 7, i % 1000, i))
+        fp.close()
+        group = hieropt.Group('mine', strict=False)
+        for i in xrange(0, 1000, 100):
+            group.register(hieropt.Int('x%s' % i))
+        def old():
+            fp = open(filename)
+            for (lineno, name, value) in oldParse(group, fp):
+                group._resolve(lineno, name).setFromString(value, hieropt.FILES)
+            fp.close()
+        def readfp():
+            fp = open(filename)
+            group.readfp(fp)
+            fp.close()
+        report('old parse', timeit(old, number=1))
+        report('readfp', timeit(readfp, number=1))
+        report('read, through mmap', timeit(lambda: group.read(filename), number=1))
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    main()
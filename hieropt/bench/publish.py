@@ -0,0 +1,75 @@
+###
+# Copyright (c) 2009, Juju, Inc.
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer. 
+#     * Redistributions in binary form must reproduce the above
+#       copyright notice, this list of conditions and the following
+#       disclaimer in the documentation and/or other materials provided
+#       with the distribution.
+#     * Neither the name of the author of this software nor the names of
+#       the contributors to the software may be used to endorse or
+#       promote products derived from this software without specific
+#       prior written permission. 
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE. 
+###
+
+
+"""Measures read throughput from published copies across reader threads while
+another thread continuously changes and republishes the tree."""
+
+import time
+import threading
+
+from hieropt.bench import makeTree
+
+def main(seconds=1.0):
+    for readers in [1, 2, 4, 8]:
+        root = makeTree(3, 10)
+        root.publish()
+        stop = []
+        counts = [0] * readers
+        publishes = [0]
+        def read(i):
+            n = 0
+            while not stop:
+                config = root.published()
+                config.n1.n2.n3()
+                config.n9.n9()
+                n += 1
+            counts[i] = n
+        def write():
+            variable = root.n1.n2.n3
+            while not stop:
+                variable.set(variable() + 1)
+                root.publish(['root.n1.n2.n3'])
+                publishes[0] += 1
+        threads = [threading.Thread(target=read, args=(i,)) for i in xrange(readers)]
+        threads.append(threading.Thread(target=write))
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.append(None)
+        for thread in threads:
+            thread.join()
+        print '%-40s %10d reads/s %8d publishes/s' % \
+              ('%s reader threads' % readers, sum(counts) / seconds, publishes[0] / seconds)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+###
+# Copyright (c) 2009, Juju, Inc.
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer. 
+#     * Redistributions in binary form must reproduce the above
+#       copyright notice, this list of conditions and the following
+#       disclaimer in the documentation and/or other materials provided
+#       with the distribution.
+#     * Neither the name of the author of this software nor the names of
+#       the contributors to the software may be used to endorse or
+#       promote products derived from this software without specific
+#       prior written permission. 
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE. 
+###
+
+
+"""Times a worker checking a shared file for a new generation, and picking one up,
+against reading the configuration file itself."""
+
+import os
+import shutil
+import tempfile
+
+import hieropt
+from hieropt import shared
+from hieropt.bench import makeTree, timeit, report
+
+def main():
+    directory = tempfile.mkdtemp()
+    try:
+        source = os.path.join(directory, 'tree.conf')
+        segment = os.path.join(directory, 'tree.shm')
+        master = makeTree(4, 10) # 11110 nodes
+        for (_, variable) in master.variables():
+            variable.set(variable() + 1, hieropt.FILES)
+        fp = open(source, 'w')
+        master.writefp(fp)
+        fp.close()
+        publisher = shared.Publisher(master, segment)
+        publisher.publish()
+        worker = makeTree(4, 10)
+        subscriber = shared.Subscriber(worker, segment)
+        subscriber()
+        report('subscriber(), same generation', timeit(subscriber, number=10000))
+        def refresh():
+            publisher.publish()
+            subscriber()
+        report('publish() and subscriber()', timeit(refresh, number=5))
+        report('read()', timeit(lambda: worker.read(source), number=5))
+        subscriber.close()
+        publisher.close()
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+###
+# Copyright (c) 2009, Juju, Inc.
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer. 
+#     * Redistributions in binary form must reproduce the above
+#       copyright notice, this list of conditions and the following
+#       disclaimer in the documentation and/or other materials provided
+#       with the distribution.
+#     * Neither the name of the author of this software nor the names of
+#       the contributors to the software may be used to endorse or
+#       promote products derived from this software without specific
+#       prior written permission. 
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE. 
+###
+
+
+"""Measures how long a cooperative event loop is stalled by reading a large file with
+read() and with readSteps()."""
+
+import os
+import time
+import shutil
+import tempfile
+
+import hieropt
+
+def run(tasks):
+    """A minimal round-robin scheduler; returns the longest time between the turns
+    of the first task, which ticks until all the others finish."""
+    longest = 0
+    last = time.time()
+    tasks = list(tasks)
+    while len(tasks) > 1:
+        now = time.time()
+        longest = max(longest, now - last)
+        last = now
+        for task in tasks[1:]:
+            try:
+                task.next()
+            except StopIteration:
+                tasks.remove(task)
+    return longest
+
+def main():
+    directory = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(directory, 'large.conf')
+        fp = open(filename, 'w')
+        for i in xrange(100000):
+            fp.write('group.n%s: %s\n' % (i, i))
+        fp.close()
+        def blocking():
+            hieropt.Group('group', Child=hieropt.Int).read(filename)
+            yield None
+        print '%-40s %10.2f ms' % ('longest stall, read()', run([None, blocking()]) * 1e3)
+        for lines in [100, 1000]:
+            steps = hieropt.Group('group', Child=hieropt.Int).readSteps([filename], lines)
+            print '%-40s %10.2f ms' % ('longest stall, readSteps(%s)' % lines,
+                                        run([None, steps]) * 1e3)
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+###
+# Copyright (c) 2009, Juju, Inc.
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer. 
+#     * Redistributions in binary form must reproduce the above
+#       copyright notice, this list of conditions and the following
+#       disclaimer in the documentation and/or other materials provided
+#       with the distribution.
+#     * Neither the name of the author of this software nor the names of
+#       the contributors to the software may be used to endorse or
+#       promote products derived from this software without specific
+#       prior written permission. 
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE. 
+###
+
+
+"""Times hieropt's main operations on generated trees, records the results as JSON,
+and compares them with a previous run to catch regressions."""
+
+import os
+import sys
+import json
+import time
+import platform
+from cStringIO import StringIO
+from optparse import OptionParser
+
+import hieropt
+from hieropt.bench import MIXED, makeTree, deepest, timeit
+
+def changedText(root):
+    """Returns configuration file text giving every variable in root a new value."""
+    fp = StringIO()
+    for (name, variable) in root.variables():
+        fp.write('%s: %s\n' % (name, variable.toString(variable())))
+    return fp.getvalue()
+
+def caseReadfp(root):
+    text = changedText(root)
+    return lambda: root.readfp(StringIO(text))
+
+def caseWritefp(root):
+    return lambda: root.writefp(StringIO())
+
+def caseReadenv(root):
+    environ = dict(os.environ)
+    for (name, variable) in root.variables()[::100]:
+        environ[name.replace('.', '_').upper()] = variable.toString(variable())
+    return lambda: root.readenv(environ)
+
+def caseToOptionParser(root):
+    return lambda: root.toOptionParser()
+
+def caseIter(root):
+    return lambda: list(root)
+
+def caseGetattr(root):
+    # Attribute access down the path to the deepest variable, whatever the tree's shape.
+    parts = deepest(root).split('.')[1:]
+    def getattrs():
+        node = root
+        for part in parts:
+            node = getattr(node, part)
+        return node
+    return getattrs
+
+def caseDefault(root):
+    # A chain of five parent defaults below the deepest variable.
+    node = root.lookup(deepest(root))
+    for i in xrange(5):
+        node = node.register(hieropt.Int('chain%s' % i, hieropt.parent))
+    return node
+
+def caseRegister(root):
+    def register():
+        group = hieropt.Group('group')
+        root.register(group)
+        for i in xrange(100):
+            group.register(hieropt.Int('n%s' % i))
+    return register
+
+# (name, case, number of calls per timing)
+CASES = [
+    ('readfp', caseReadfp, 3),
+    ('writefp', caseWritefp, 3),
+    ('readenv', caseReadenv, 10),
+    ('toOptionParser', caseToOptionParser, 3),
+    ('__iter__', caseIter, 10),
+    ('__getattr__', caseGetattr, 10000),
+    ('default', caseDefault, 10000),
+    ('register', caseRegister, 10),
+]
+
+def run(depth=4, fanout=6, seed=0, cases=None):
+    """Runs the benchmarks on a tree of the given shape and returns the results as a
+    dict, ready to be dumped as JSON."""
+    results = {}
+    for (name, case, number) in CASES:
+        if cases and name not in cases:
+            continue
+        root = makeTree(depth, fanout, mix=MIXED, seed=seed)
+        results[name] = timeit(case(root), number=number)
+    return {
+        'time': time.time(),
+        'python': platform.python_version(),
+        'tree': {'depth': depth, 'fanout': fanout, 'seed': seed,
+                 'nodes': len(list(makeTree(depth, fanout)))},
+        'results': results,
+        }
+
+def compare(baseline, current, threshold=0.2):
+    """Returns a list of (name, baseline seconds, current seconds) for every benchmark
+    which got slower by more than the given fraction."""
+    regressions = []
+    for (name, seconds) in sorted(current['results'].iteritems()):
+        before = baseline['results'].get(name)
+        if before is not None and seconds > before * (1 + threshold):
+            regressions.append((name, before, seconds))
+    return regressions
+
+def main(args=None):
+    parser = OptionParser(usage='%prog [options] [case ...]')
+    parser.add_option('--depth', type='int', default=4)
+    parser.add_option('--fanout', type='int', default=6)
+    parser.add_option('--seed', type='int', default=0)
+    parser.add_option('--output', metavar='FILE', help='write the results as JSON to FILE')
+    parser.add_option('--compare', metavar='FILE',
+                      help='compare the results with those in FILE, a previous --output')
+    parser.add_option('--threshold', type='float', default=0.2,
+                      help='the fraction by which a benchmark may slow down before '
+                           'it counts as a regression')
+    (options, cases) = parser.parse_args(args)
+    if options.depth < 1 or options.fanout < 1:
+        parser.error('the tree needs a depth and fanout of at least 1')
+    current = run(options.depth, options.fanout, options.seed, cases)
+    baseline = None
+    if options.compare:
+        fp = open(options.compare)
+        try:
+            baseline = json.load(fp)
+        finally:
+            fp.close()
+    for (name, seconds) in sorted(current['results'].iteritems()):
+        line = '%-40s %10.2f us' % (name, seconds * 1e6)
+        if baseline is not None and name in baseline['results']:
+            line += ' %+7.1f%%' % ((seconds / baseline['results'][name] - 1) * 100)
+        print line
+    if options.output:
+        fp = open(options.output, 'w')
+        try:
+            json.dump(current, fp, indent=2, sort_keys=True)
+        finally:
+            fp.close()
+    if baseline is not None:
+        regressions = compare(baseline, current, options.threshold)
+        for (name, before, seconds) in regressions:
+            print 'REGRESSION: %s went from %.2f us to %.2f us' % \
+                  (name, before * 1e6, seconds * 1e6)
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,55 @@
+###
+# Copyright (c) 2009, Juju, Inc.
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer. 
+#     * Redistributions in binary form must reproduce the above
+#       copyright notice, this list of conditions and the following
+#       disclaimer in the documentation and/or other materials provided
+#       with the distribution.
+#     * Neither the name of the author of this software nor the names of
+#       the contributors to the software may be used to endorse or
+#       promote products derived from this software without specific
+#       prior written permission. 
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE. 
+###
+
+
+"""Times writefp on a large, commented tree, in full and with onlyChanged."""
+
+from cStringIO import StringIO
+
+import hieropt
+from hieropt.bench import makeTree, timeit, report
+
+def main():
+    root = makeTree(4, 10) # 11110 variables
+    for (_, variable) in root.variables():
+        variable._comment = 'The %s variable, which is documented at some length so ' \
+                            'that its comment has to be wrapped.' % variable._name
+    for name in ['root.n1.n2.n3.n4', 'root.n9']:
+        root.lookup(name).set(0)
+    report('writefp', timeit(lambda: root.writefp(StringIO()), number=5))
+    report('writefp, annotate=False',
+           timeit(lambda: root.writefp(StringIO(), annotate=False), number=5))
+    report('writefp, onlyChanged=True',
+           timeit(lambda: root.writefp(StringIO(), onlyChanged=True), number=5))
+
+if __name__ == '__main__':
+    main()
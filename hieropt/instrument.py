@@ -0,0 +1,152 @@
+###
+# Copyright (c) 2009, Juju, Inc.
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer. 
+#     * Redistributions in binary form must reproduce the above
+#       copyright notice, this list of conditions and the following
+#       disclaimer in the documentation and/or other materials provided
+#       with the distribution.
+#     * Neither the name of the author of this software nor the names of
+#       the contributors to the software may be used to endorse or
+#       promote products derived from this software without specific
+#       prior written permission. 
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE. 
+###
+
+
+"""Opt-in instrumentation of configuration variables: how often each is read, how
+often its callable or hieropt.parent default is evaluated, and how often and for how
+long its values are converted from strings.
+
+Instrumentation works by replacing methods of hieropt.Value (and the fromString
+methods of its subclasses) while enabled, and restoring the originals when disabled,
+so it costs nothing at all when it isn't enabled.  Subclasses which override
+__call__ or setFromString themselves, or which are defined after enable() is
+called, aren't counted.  Counters hold references to the variables they count until
+reset() is called.
+"""
+
+import time
+import types
+
+import hieropt
+
+FIELDS = ('calls', 'defaults', 'setFromString', 'conversions', 'seconds')
+_CALLS, _DEFAULTS, _SETS, _CONVERSIONS, _SECONDS = range(len(FIELDS))
+
+_counters = {} # variable -> list of counts, in the order of FIELDS
+_originals = {} # (class, attribute name) -> the original class attribute
+
+def _counter(variable):
+    try:
+        return _counters[variable]
+    except KeyError:
+        counter = _counters[variable] = [0, 0, 0, 0, 0.0]
+        return counter
+
+def _allSubclasses(cls):
+    classes = [cls]
+    for subclass in cls.__subclasses__():
+        classes.extend(_allSubclasses(subclass))
+    return classes
+
+def _instrumentCall(original):
+    def __call__(self):
+        _counter(self)[_CALLS] += 1
+        return original(self)
+    return __call__
+
+def _instrumentDefault(original):
+    def default(self):
+        if callable(self._default) or self._default is hieropt.parent:
+            _counter(self)[_DEFAULTS] += 1
+        return original.fget(self)
+    return property(default)
+
+def _instrumentSetFromString(original):
+    def setFromString(self, s, *args):
+        _counter(self)[_SETS] += 1
+        return original(self, s, *args)
+    return setFromString
+
+def _instrumentFromString(original):
+    # Float.fromString is float itself, which isn't bound to instances.
+    bind = isinstance(original, (types.FunctionType, staticmethod, classmethod))
+    def fromString(self, s):
+        if bind:
+            convert = original.__get__(self, type(self))
+        else:
+            convert = original
+        start = time.time()
+        try:
+            return convert(s)
+        finally:
+            counter = _counter(self)
+            counter[_CONVERSIONS] += 1
+            counter[_SECONDS] += time.time() - start
+    return fromString
+
+def _replace(cls, name, instrument):
+    original = cls.__dict__[name]
+    _originals[(cls, name)] = original
+    setattr(cls, name, instrument(original))
+
+def enable():
+    """Starts counting.  Calling enable() when already enabled does nothing."""
+    if _originals:
+        return
+    _replace(hieropt.Value, '__call__', _instrumentCall)
+    _replace(hieropt.Value, 'default', _instrumentDefault)
+    _replace(hieropt.Value, 'setFromString', _instrumentSetFromString)
+    for cls in _allSubclasses(hieropt.Value):
+        if 'fromString' in cls.__dict__:
+            _replace(cls, 'fromString', _instrumentFromString)
+
+def disable():
+    """Stops counting, restoring the original methods.  The counts are kept."""
+    for ((cls, name), original) in _originals.iteritems():
+        setattr(cls, name, original)
+    _originals.clear()
+
+def enabled():
+    return bool(_originals)
+
+def reset():
+    """Forgets all the counts."""
+    _counters.clear()
+
+def stats(group):
+    """Returns a dict mapping the name (as generated by iterating the group) of every
+    node in the given group to a dict of its counts, keyed by the names in FIELDS.
+    Each node's dict also has a 'subtree' dict of the same counts summed over the
+    node and all its descendants."""
+    flat = list(group)
+    names = dict((id(node), name) for (name, node) in flat)
+    result = {}
+    for (name, node) in flat:
+        own = dict(zip(FIELDS, _counters.get(node, (0, 0, 0, 0, 0.0))))
+        own['subtree'] = dict(zip(FIELDS, _counters.get(node, (0, 0, 0, 0, 0.0))))
+        result[name] = own
+    # Preorder reversed visits every node after all its descendants.
+    for (name, node) in reversed(flat[1:]):
+        parentTotals = result[names[id(node._parent)]]['subtree']
+        for field in FIELDS:
+            parentTotals[field] += result[name]['subtree'][field]
+    return result
@@ -0,0 +1,204 @@
+###
+# Copyright (c) 2009, Juju, Inc.
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer. 
+#     * Redistributions in binary form must reproduce the above
+#       copyright notice, this list of conditions and the following
+#       disclaimer in the documentation and/or other materials provided
+#       with the distribution.
+#     * Neither the name of the author of this software nor the names of
+#       the contributors to the software may be used to endorse or
+#       promote products derived from this software without specific
+#       prior written permission. 
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE. 
+###
+
+
+"""Sharing a configuration between processes on one host through a memory-mapped file.
+
+A master process, typically a pre-fork server, makes a Publisher for its configuration
+group and calls publish() after reading (or reloading) its files.  Each worker makes a
+Subscriber for its own copy of the same tree, and calls it to get the group: calling
+a subscriber first checks the generation counter in the shared file, which costs one
+read from shared memory, and only when a new generation has been published sets the
+values published, without parsing anything.  Values are stored in the snapshot format
+(see Group.dumpSnapshot) and decoded straight from the shared pages.
+
+The file holds two slots; each generation is written to the slot the last one
+wasn't, and the generation counter is only advanced once it's complete, so readers
+rarely wait for the publisher.  Each slot has a sequence number which is made odd
+before the slot is written and even again after, so a reader whose slot was
+written while it was being decoded (because two generations were published in the
+meantime) sees the sequence number change and reads it again.  There must only be
+one publisher per file at a time; a publisher made for a file an earlier one left
+behind carries on from its last generation.  Like snapshots, only the values read from files are shared, and
+workers set them in the FILES layer.
+
+    # In the master, before forking:
+    publisher = hieropt.shared.Publisher(config, '/dev/shm/myapp.conf')
+    publisher.publish()
+    # In each worker:
+    subscriber = hieropt.shared.Subscriber(config, '/dev/shm/myapp.conf')
+    ...
+    timeout = subscriber().timeout()
+"""
+
+import os
+import mmap
+import struct
+import marshal
+
+import hieropt
+
+MAGIC = 'hieropt shared 2'
+DEFAULT_SIZE = 1 << 22
+
+# The header holds the magic string, the latest generation, and for each of the two
+# slots, which follow it, its sequence number, generation, and the length of its data.
+_GENERATION = 16
+_SLOTS = 24
+_SLOT_HEADER = 24
+_HEADER = 128
+
+class Publisher(object):
+    """Writes the values of a group to a shared file for Subscribers to read."""
+    def __init__(self, group, filename, size=DEFAULT_SIZE):
+        """
+        @param group: The group to publish.
+        @param filename: The name of the file to share; on Linux, a file in /dev/shm
+                         is never written to disk.  It's created if necessary.
+        @param size: The size of the file.  Half of it, less the header, is the
+                     largest encoded configuration which can be published.
+        """
+        self._group = group
+        fd = os.open(filename, os.O_RDWR | os.O_CREAT, 0644)
+        try:
+            os.ftruncate(fd, size)
+            self._map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        self._slotSize = (size - _HEADER) // 2
+        if self._map[:len(MAGIC)] == MAGIC:
+            # Left by an earlier publisher, as when the master restarts: carry on from
+            # its generation and sequence numbers, so that subscribers which have
+            # applied its generations see the new ones as newer.
+            self._generation = struct.unpack_from('Q', self._map, _GENERATION)[0]
+        else:
+            self._map[:_HEADER] = MAGIC + '\0' * (_HEADER - len(MAGIC))
+            self._generation = 0
+
+    def publish(self):
+        """Writes the group's current values as a new generation, and returns it."""
+        data = marshal.dumps(self._group._snapshotValues(), 2)
+        if len(data) > self._slotSize:
+            raise ValueError('Configuration of %s bytes is too large for a shared file '
+                             'of %s bytes.' % (len(data), len(self._map)))
+        generation = self._generation + 1
+        slot = generation % 2
+        header = _SLOTS + slot * _SLOT_HEADER
+        start = _HEADER + slot * self._slotSize
+        # Odd while the slot is written; or'ed in case a write was interrupted.
+        sequence = struct.unpack_from('Q', self._map, header)[0] | 1
+        struct.pack_into('Q', self._map, header, sequence)
+        self._map[start:start+len(data)] = data
+        struct.pack_into('QQ', self._map, header + 8, generation, len(data))
+        struct.pack_into('Q', self._map, header, sequence + 1)
+        struct.pack_into('Q', self._map, _GENERATION, generation)
+        self._generation = generation
+        return generation
+
+    def close(self):
+        self._map.close()
+
+
+class Subscriber(object):
+    """Keeps a group up to date with the values published to a shared file."""
+    def __init__(self, group, filename):
+        """
+        @param group: The group to set the published values in.  Its tree must have
+                      the variables the publisher's group has.
+        @param filename: The name of the shared file, as given to the Publisher.
+        """
+        self._group = group
+        fd = os.open(filename, os.O_RDONLY)
+        try:
+            self._map = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+        if self._map[:len(MAGIC)] != MAGIC:
+            self._map.close()
+            raise ValueError('%s is not a hieropt shared file.' % filename)
+        self._slotSize = (len(self._map) - _HEADER) // 2
+        self._generation = 0
+        self._names = ()
+
+    def __call__(self):
+        """Returns the group, after setting the values of any newer generation."""
+        self.refresh()
+        return self._group
+
+    def generation(self):
+        """Returns the latest generation published."""
+        return struct.unpack_from('Q', self._map, _GENERATION)[0]
+
+    def refresh(self):
+        """Sets the values of the latest generation, unless they already have been.
+        Variables which the latest generation no longer has a value for lose the
+        value the previous one gave them.  Returns whether anything was set."""
+        if self.generation() == self._generation:
+            return False
+        while True:
+            slot = self.generation() % 2
+            header = _SLOTS + slot * _SLOT_HEADER
+            sequence = struct.unpack_from('Q', self._map, header)[0]
+            if sequence % 2:
+                continue # The slot is being written.
+            (generation, length) = struct.unpack_from('QQ', self._map, header + 8)
+            start = _HEADER + slot * self._slotSize
+            try:
+                (names, values, pickled) = marshal.loads(buffer(self._map, start, length))
+            except (ValueError, EOFError, TypeError):
+                decoded = False
+            else:
+                decoded = True
+            if struct.unpack_from('Q', self._map, header)[0] == sequence:
+                if not decoded:
+                    raise ValueError('Generation %s of the shared file is corrupt.' %
+                                     generation)
+                break
+            # Otherwise the slot was written while it was decoded.
+        if generation == self._generation:
+            return False
+        group = self._group
+        with hieropt.Transaction():
+            for name in set(self._names).difference(names):
+                try:
+                    group.lookup(name).set(None, hieropt.FILES)
+                except KeyError:
+                    continue
+            if not group._loadSnapshotValues(names, values, pickled):
+                raise KeyError('Generation %s of the shared file has variables %s '
+                               'doesn\'t.' % (generation, group._name))
+        self._names = names
+        self._generation = generation
+        return True
+
+    def close(self):
+        self._map.close()
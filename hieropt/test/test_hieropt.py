@@ -30,7 +30,13 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE. 
 ###
 
+import os
+import sys
 import copy
+import array
+import shutil
+import tempfile
+import threading
 from cStringIO import StringIO as sio
 
 import hieropt
@@ -400,3 +406,768 @@ notsimple.somethingelse: True
     simple.readfp(sio(s))
     assert_equals(simple.int(), 1)
     assert_equals(simple.float(), 2.0)
+    simple.readfp(sio('simple.unknown: 1\nsimple.int: 3\n'))
+    assert_equals(simple.int(), 3)
+
+def test_nonstrict_read():
+    directory = tempfile.mkdtemp()
+    filename = os.path.join(directory, 'shared.conf')
+    fp = open(filename, 'w')
+    fp.write('other.x: simple.int: 5\n'
+             'simpler.int: 6\n'
+             'not even a setting\n'
+             '  simple.int: 2\n'
+             '# simple.float: 3.0\n'
+             'simple.unknown: 4\n'
+             'simple.bool = True')
+    fp.close()
+    try:
+        simple = makeSimple(strict=False)
+        simple.read(filename)
+        assert_equals(simple.int(), 2)
+        assert_equals(simple.float(), None)
+        assert_equals(simple.bool(), True)
+        assert_equals(simple._parseFile(filename),
+                      [(4, 'simple.int', '2'), (6, 'simple.unknown', '4'),
+                       (7, 'simple.bool', 'True')])
+        open(filename, 'w').close()
+        assert_equals(simple._parseFile(filename), [])
+    finally:
+        shutil.rmtree(directory)
+
+def test_lookup():
+    simple = makeSimple()
+    simple.int.register(hieropt.Int('x'))
+    assert_equals(simple.lookup('simple.int'), simple.int)
+    assert_equals(simple.lookup('simple.int.x'), simple.int.x)
+    assert_equals(simple.int.lookup('int.x'), simple.int.x)
+    assert_raises(KeyError, simple.lookup, 'simple.nonexistent')
+    assert_raises(KeyError, simple.lookup, 'notsimple.int')
+    # A sibling's name isn't in this group's subtree.
+    assert_raises(KeyError, simple.int.lookup, 'bool')
+
+def test_lookup_follows_register():
+    config = hieropt.Group('config')
+    config.lookup('config') # Builds the index.
+    sub = makeSimple()
+    sub.int.register(hieropt.Int('x'))
+    sub.lookup('simple.int.x')
+    config.register(sub)
+    assert_equals(config.lookup('config.simple.int.x'), sub.int.x)
+    assert_equals(sub.lookup('simple.int.x'), sub.int.x)
+    replacement = hieropt.Int('int')
+    sub.register(replacement)
+    assert_equals(config.lookup('config.simple.int'), replacement)
+    assert_raises(KeyError, config.lookup, 'config.simple.int.x')
+    config.register(hieropt.Group('ints', Child=hieropt.Int))
+    assert_equals(config.lookup('config.ints.y'), config.ints.y)
+
+def test_fullnames_follow_register():
+    simple = makeSimple()
+    simple.int.register(hieropt.Int('x'))
+    assert_equals([name for (name, _) in simple.int],
+                  ['int', 'int.x'])
+    assert_equals([name for (name, _) in simple],
+                  ['simple', 'simple.int', 'simple.int.x',
+                   'simple.bool', 'simple.float'])
+    config = hieropt.Group('config')
+    config.register(simple)
+    assert_equals([name for (name, _) in simple],
+                  ['simple', 'simple.int', 'simple.int.x',
+                   'simple.bool', 'simple.float'])
+    simple.int.x.set(1)
+    fp = sio()
+    config.writefp(fp, annotate=False)
+    assert 'config.simple.int.x: 1' in fp.getvalue().splitlines()
+
+def test_iter_follows_register():
+    simple = makeSimple()
+    assert_equals(len(list(simple)), 4)
+    assert_equals(len(list(simple.int)), 1)
+    simple.int.register(hieropt.Int('x'))
+    assert_equals(list(simple)[2], ('simple.int.x', simple.int.x))
+    assert_equals(list(simple.int)[1], ('int.x', simple.int.x))
+
+def test_variables():
+    config = hieropt.Group('config')
+    config.register(makeSimple())
+    config.simple.int.register(hieropt.Int('x'))
+    assert_equals(config.variables(),
+                  [(name, variable) for (name, variable) in config
+                   if variable.expectsValue()])
+    assert_equals([name for (name, _) in config.simple.variables()],
+                  ['simple.int', 'simple.int.x', 'simple.bool', 'simple.float'])
+
+def test_memoized_defaults():
+    calls = []
+    def callable_default():
+        calls.append(None)
+        return 1
+    config = hieropt.Group('config')
+    config.register(hieropt.Int('x', default=callable_default, memoize=True))
+    config.x.register(hieropt.Int('y', default=hieropt.parent, memoize=True))
+    assert_equals(config.x.y(), 1)
+    assert_equals(config.x.y(), 1)
+    assert_equals(config.x(), 1)
+    assert_equals(len(calls), 1)
+    config.x.set(2)
+    assert_equals(config.x.y(), 2)
+    config.x.reset()
+    assert_equals(config.x.y(), 1)
+    assert_equals(len(calls), 2)
+    config.readfp(sio('config.x: 3\n'))
+    assert_equals(config.x.y(), 3)
+
+def test_compact_nodes():
+    simple = makeSimple()
+    assert not hasattr(simple.int, '__dict__')
+    assert_equals(simple.int.children(), [])
+    assert_equals(simple.int._children, None)
+    assert_raises(KeyError, simple.int.get, 'x')
+    assert_equals([child._name for child in simple.children()],
+                  ['int', 'bool', 'float'])
+
+def test_flyweight_group():
+    config = hieropt.Group('config')
+    config.register(hieropt.Group('ints', Child=lambda name: hieropt.Int(name, 1),
+                                  flyweight=True))
+    x = config.ints.x
+    assert isinstance(x, hieropt.Placeholder)
+    assert config.ints.x is x
+    assert_equals(x(), 1)
+    assert x.isDefault()
+    assert_equals(config.lookup('config.ints.x'), x)
+    assert_equals(config.ints.y(), 1)
+    assert_write_then_read_equivalence(config)
+    x.set(2)
+    assert isinstance(config.ints.x, hieropt.Int)
+    assert_equals(x(), 2)
+    assert_equals(config.ints.x(), 2)
+    assert_equals(config.ints.y(), 1)
+    assert_equals([name for (name, _) in config],
+                  ['config', 'config.ints', 'config.ints.x', 'config.ints.y'])
+    assert_equals(config.ints.children(materializedOnly=True), [config.ints.x])
+    assert_write_then_read_equivalence(config)
+    fp = sio()
+    config.writefp(fp, annotate=False, materializedOnly=True)
+    assert_equals(fp.getvalue(), 'config.ints.x: 2\n')
+    config.readfp(sio('config.ints.z: 3\n'))
+    assert_equals(config.ints.z(), 3)
+    config.ints.w # A placeholder.
+    parser = config.toOptionParser()
+    parser.parse_args(['--config-ints-w', '4'])
+    assert_equals(config.ints.w(), 4)
+    assert_raises(ValueError, hieropt.Group, 'ints', flyweight=True)
+    config.ints.v
+    assert_equals(config._snapshotValues()[0], ['config.ints.x', 'config.ints.z'])
+    assert isinstance(config.ints.v, hieropt.Placeholder)
+    assert isinstance(config.ints.z, hieropt.Int)
+
+def test_snapshot():
+    directory = tempfile.mkdtemp()
+    source = os.path.join(directory, 'simple.conf')
+    snapshot = os.path.join(directory, 'simple.snapshot')
+    fp = open(source, 'w')
+    fp.write('simple.int: 2\nsimple.float: 0.5\n')
+    fp.close()
+    simple = makeSimpleWithDefaults()
+    assert not simple.loadSnapshot(snapshot)
+    simple.read(source)
+    simple.dumpSnapshot(snapshot, [source])
+    simple = makeSimpleWithDefaults()
+    assert simple.loadSnapshot(snapshot)
+    assert_equals(simple.int(), 2)
+    assert_equals(simple.bool(), True)
+    assert_equals(simple.float(), 0.5)
+    assert simple.bool.isDefault()
+    assert not hieropt.Group('simple').loadSnapshot(snapshot)
+    os.utime(source, (0, 0)) # Same content with a new mtime is still valid.
+    assert makeSimpleWithDefaults().loadSnapshot(snapshot)
+    fp = open(source, 'w')
+    fp.write('simple.int: 3\nsimple.float: 0.5\n')
+    fp.close()
+    os.utime(source, (0, 0))
+    assert not makeSimpleWithDefaults().loadSnapshot(snapshot)
+    # Reloading after loading a snapshot sees what the snapshot stood in for.
+    fp = open(source, 'w')
+    fp.write('simple.int: 2\nsimple.float: 0.5\n')
+    fp.close()
+    simple.dumpSnapshot(snapshot, [source])
+    simple = makeSimpleWithDefaults()
+    assert simple.loadSnapshot(snapshot)
+    fp = open(source, 'w')
+    fp.write('simple.int: 2\n')
+    fp.close()
+    assert_equals(simple.reload(source), hieropt.Changes([], [], ['simple.float']))
+    assert simple.float.isDefault()
+    shutil.rmtree(directory)
+
+def test_reload():
+    directory = tempfile.mkdtemp()
+    filename = os.path.join(directory, 'simple.conf')
+    def write(s):
+        fp = open(filename, 'w')
+        fp.write(s)
+        fp.close()
+    write('simple.int: 1\nsimple.bool: True\n')
+    simple = makeSimpleWithDefaults()
+    simple.read(filename)
+    simple.bool.set(False) # Not in the file's changes, so reload keeps it.
+    simple.publish()
+    write('simple.int: 2\nsimple.bool: True\nsimple.float: 0.5\n')
+    changes = simple.reload(filename)
+    assert_equals(changes, hieropt.Changes(['simple.float'], ['simple.int'], []))
+    assert_equals(simple.published().int(), 2)
+    assert_equals(simple.int(), 2)
+    assert_equals(simple.bool(), False)
+    assert_equals(simple.float(), 0.5)
+    write('simple.int: 2\nsimple.float: x\n')
+    assert_raises(ValueError, simple.reload, filename)
+    assert_equals(simple.float(), 0.5)
+    write('simple.int: 2\n')
+    changes = simple.reload(filename)
+    assert_equals(changes.added, [])
+    assert_equals(changes.changed, [])
+    assert_equals(sorted(changes.removed), ['simple.bool', 'simple.float'])
+    assert simple.float.isDefault()
+    # The value set at runtime outlives the file's.
+    assert_equals(simple.bool.layerValue(hieropt.FILES), None)
+    assert_equals(simple.bool(), False)
+    write('simple.int: 1\nsimple.int: 3\n')
+    assert_equals(simple.reload(filename), hieropt.Changes([], ['simple.int'], []))
+    assert_equals(simple.int(), 3)
+    assert_equals(simple.reload(filename), hieropt.Changes([], [], []))
+    shutil.rmtree(directory)
+
+def test_reload_republishes():
+    directory = tempfile.mkdtemp()
+    filename = os.path.join(directory, 'config.conf')
+    def write(s):
+        fp = open(filename, 'w')
+        fp.write(s)
+        fp.close()
+    try:
+        config = hieropt.Group('config')
+        config.register(hieropt.Int('x', 0))
+        config.register(hieropt.Int('y', 0))
+        config.register(hieropt.Int('z', lambda: config.x() * 2))
+        write('config.x: 1\n')
+        config.read(filename)
+        config.publish()
+        config.y.set(3)
+        write('config.x: 5\n')
+        config.reload(filename)
+        published = config.published()
+        assert_equals((published.x(), published.y(), published.z()), (5, 3, 10))
+    finally:
+        shutil.rmtree(directory)
+
+def test_publish():
+    config = hieropt.Group('config')
+    config.register(makeSimpleWithDefaults())
+    config.register(hieropt.Group('other'))
+    config.other.register(hieropt.Int('x', 1))
+    config.other.x.register(hieropt.Int('y', hieropt.parent))
+    assert_equals(config.published(), None)
+    first = config.publish()
+    assert_equals(first.simple.int(), 1)
+    assert_equals(first.lookup('config.other.x.y')(), 1)
+    assert_raises(hieropt.GroupExpectsNoValue, first.simple)
+    assert_raises(AttributeError, getattr, first, 'nonexistent')
+    config.other.x.set(2)
+    assert_equals(first.other.x.y(), 1)
+    second = config.publish()
+    assert config.published() is second
+    assert_equals(second.other.x(), 2)
+    assert_equals(second.other.x.y(), 2)
+    assert second.simple is first.simple
+    config.simple.int.set(3)
+    config.simple.register(hieropt.Int('new', 4))
+    third = config.publish(['config.simple.int', 'config.simple.new'])
+    assert_equals(third.simple.int(), 3)
+    assert_equals(third.simple.new(), 4)
+    assert_equals(second.simple.int(), 1)
+    assert third.other is second.other
+    assert third.simple.bool is second.simple.bool
+
+def test_concurrent_get():
+    for flyweight in [False, True]:
+        group = hieropt.Group('group', Child=hieropt.Int, flyweight=flyweight)
+        names = ['n%s' % i for i in xrange(200)]
+        results = []
+        def get():
+            results.append([group.get(name) for name in names])
+        threads = [threading.Thread(target=get) for _ in xrange(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert_equals(len(group.children()), len(names))
+        for result in results:
+            assert_equals(result, group.children())
+
+def test_read_steps():
+    directory = tempfile.mkdtemp()
+    group = hieropt.Group('group', Child=hieropt.Int)
+    filenames = []
+    for i in xrange(3):
+        filename = os.path.join(directory, '%s.conf' % i)
+        fp = open(filename, 'w')
+        for j in xrange(250):
+            fp.write('group.n%s: %s\n' % (j, i))
+        fp.close()
+        filenames.append(filename)
+    # Between two turns of the event loop, the reader never handles more than
+    # one step's worth of lines, and nothing is set until every file is parsed.
+    sizes = []
+    for _ in group.readSteps(filenames, lines=100):
+        sizes.append(len(group.children()))
+    assert_equals(sizes[:12], [0] * 12)
+    assert_equals(sizes[12:], [100, 200] + [250] * 7)
+    assert_equals(group.n0(), 2)
+    assert_equals(group.n249(), 2)
+    list(group.readfpSteps(sio('group.n0: 5\ngroup.n1: 5\n'), lines=1))
+    assert_equals(group.n0(), 5)
+    list(group.readenvSteps({'GROUP_N2': '6'}, variables=10))
+    assert_equals(group.n2(), 6)
+    shutil.rmtree(directory)
+
+def test_read_directory():
+    directory = tempfile.mkdtemp()
+    def write(name, s):
+        fp = open(os.path.join(directory, name), 'w')
+        fp.write(s)
+        fp.close()
+    write('10-base.conf', 'simple.int: 1\nsimple.bool: True\n')
+    write('20-override.conf', 'simple.int: 2\n')
+    write('ignored.txt', 'simple.int: 3\n')
+    for workers in [1, 4]:
+        simple = makeSimple()
+        filenames = simple.readDirectory(directory, workers=workers)
+        assert_equals([os.path.basename(filename) for filename in filenames],
+                      ['10-base.conf', '20-override.conf'])
+        assert_equals(simple.int(), 2)
+        assert_equals(simple.bool(), True)
+    write('15-broken.conf', '\nsimple.float: x\n')
+    simple = makeSimple()
+    try:
+        simple.readDirectory(directory, workers=4)
+        assert False, 'readDirectory should have raised InvalidValue'
+    except hieropt.InvalidValue, e:
+        assert_equals(e.lineno, 2)
+        assert_equals(os.path.basename(e.filename), '15-broken.conf')
+    assert_equals(simple.int(), None)
+    shutil.rmtree(directory)
+
+def test_read_directory_reload():
+    directory = tempfile.mkdtemp()
+    def write(name, s):
+        fp = open(os.path.join(directory, name), 'w')
+        fp.write(s)
+        fp.close()
+    try:
+        write('10-a.conf', 'simple.int: 1\nsimple.float: 0.5\n')
+        write('20-b.conf', 'simple.int: 2\n')
+        simple = makeSimple()
+        simple.readDirectory(directory)
+        first = os.path.join(directory, '10-a.conf')
+        # The later file still wins over the reloaded earlier one.
+        write('10-a.conf', 'simple.int: 5\nsimple.float: 0.5\n')
+        assert_equals(simple.reload(first), hieropt.Changes([], ['simple.int'], []))
+        assert_equals(simple.int(), 2)
+        # A name dropped from one file keeps the value another gives it.
+        write('10-a.conf', 'simple.float: 0.5\n')
+        assert_equals(simple.reload(first), hieropt.Changes([], [], ['simple.int']))
+        assert_equals(simple.int(), 2)
+        second = os.path.join(directory, '20-b.conf')
+        write('10-a.conf', 'simple.int: 3\n')
+        simple.reload(first)
+        write('20-b.conf', '')
+        simple.reload(second)
+        assert_equals(simple.int(), 3)
+        assert_equals(simple.float(), None)
+        # Reading a file again makes it the last read.
+        write('20-b.conf', 'simple.int: 4\n')
+        simple.reload(second)
+        assert_equals(simple.int(), 4)
+        simple.read(first)
+        assert_equals(simple.int(), 3)
+    finally:
+        shutil.rmtree(directory)
+
+def test_env_index():
+    simple = makeSimple()
+    simple.readenv({'SIMPLE_INT': '1', 'OTHER_FLOAT': '2.0', 'SIMPLE': 'x'})
+    assert_equals(simple.int(), 1)
+    assert_equals(simple.float(), None)
+    assert_equals(simple.envCollisions(), {})
+    simple.register(hieropt.Group('int_x')).register(hieropt.Int('y'))
+    simple.int.register(hieropt.Int('x'))
+    simple.int.x.register(hieropt.Int('y'))
+    assert_equals(simple.envCollisions(),
+                  {'SIMPLE_INT_X_Y': ['simple.int.x.y', 'simple.int_x.y']})
+    simple.readenv({'SIMPLE_INT_X_Y': '2'})
+    assert_equals(simple.int.x.y(), 2)
+    assert_equals(simple.int_x.y(), 2)
+    assert_raises(ValueError, simple.readenv, {'SIMPLE_BOOL': 'maybe'})
+
+def test_parseArgs():
+    simple = makeSimple()
+    args = simple.parseArgs(['a', '--simple-int', '0', '--simple-float=0.5',
+                             '--simple-b', 'yes', 'b', '--', '--simple-int'])
+    assert_equals(args, ['a', 'b', '--simple-int'])
+    assert_equals(simple.int(), 0)
+    assert_equals(simple.float(), 0.5)
+    assert_equals(simple.bool(), True)
+    simple.register(hieropt.Int('bool2'))
+    def parseArgs(args):
+        # optparse reports errors (and help) on stderr and exits.
+        stderr = sys.stderr
+        sys.stderr = sio()
+        try:
+            simple.parseArgs(args)
+        finally:
+            sys.stderr = stderr
+    assert_raises(SystemExit, parseArgs, ['--simple-b', 'yes'])
+    assert_raises(SystemExit, parseArgs, ['--simple-nonexistent', '1'])
+    assert_raises(SystemExit, parseArgs, ['--simple-int', 'x'])
+    assert_raises(SystemExit, parseArgs, ['--simple-int'])
+    assert_equals(simple.int(), 0)
+
+def test_writefp_only_changed():
+    config = hieropt.Group('config', comment='config group')
+    config.register(makeSimpleWithDefaultsAndComments())
+    config.register(hieropt.Group('other', comment='other group'))
+    config.other.register(hieropt.Int('x', 1))
+    fp = sio()
+    config.writefp(fp, onlyChanged=True)
+    assert_equals(fp.getvalue(), '')
+    config.simple.int.set(2)
+    config.simple.int.set(3)
+    assert_equals(config._dirty, 1)
+    fp = sio()
+    config.writefp(fp, onlyChanged=True)
+    assert_equals(fp.getvalue(), '# config group\n\n# simple group\n\n'
+                                 '# simple int\nconfig.simple.int: 3\n\n')
+    fp = sio()
+    config.writefp(fp, annotate=False, onlyChanged=True)
+    assert_equals(fp.getvalue(), 'config.simple.int: 3\n')
+    config.simple.int.reset()
+    assert_equals(config._dirty, 0)
+    sub = hieropt.Group('sub')
+    sub.register(hieropt.Int('y')).set(1)
+    config.other.register(sub)
+    assert_equals(config._dirty, 1)
+    config.other.register(hieropt.Group('sub'))
+    assert_equals(config._dirty, 0)
+
+def test_lazy_read():
+    converted = []
+    class Recording(hieropt.Int):
+        def fromString(self, s):
+            converted.append(self._name)
+            return hieropt.Int.fromString(self, s)
+    config = hieropt.Group('config', Child=Recording)
+    config.readfp(sio('config.x: 1\nconfig.y: 2\nconfig.z: bad\n'), lazy=True)
+    assert_equals(converted, [])
+    assert not config.x.isDefault()
+    assert_equals(config.x(), 1)
+    assert_equals(config.x(), 1)
+    assert_equals(converted, ['x'])
+    fp = sio()
+    config.writefp(fp, annotate=False, onlyChanged=True)
+    assert_equals(fp.getvalue(), 'config.x: 1\nconfig.y: 2\nconfig.z: bad\n')
+    assert_raises(ValueError, config.z)
+    errors = config.validateAll()
+    assert_equals([name for (name, _) in errors], ['config.z'])
+    assert_equals(converted, ['x', 'z', 'y', 'z'])
+    config.z.reset()
+    assert_equals(config.validateAll(), [])
+    assert_equals(config._dirty, 2)
+    config.readenv({'CONFIG_Y': '4'}, lazy=True)
+    assert_equals(config.y(), 4)
+    config.readfp(sio('config.x: bad\n'), lazy=True)
+    config.x.set(5)
+    assert_equals([name for (name, _) in config.validateAll()], ['config.x'])
+    config.x.reset()
+
+def test_read_lazy_published():
+    directory = tempfile.mkdtemp()
+    filename = os.path.join(directory, 'config.conf')
+    try:
+        fp = open(filename, 'w')
+        fp.write('config.x: 1\nconfig.y: bad\n')
+        fp.close()
+        config = hieropt.Group('config', Child=hieropt.Int)
+        config.get('x')
+        config.get('y')
+        first = config.publish()
+        config.read(filename, lazy=True)
+        assert config.published() is first
+        assert_equals([name for (name, _) in config.validateAll()], ['config.y'])
+    finally:
+        shutil.rmtree(directory)
+
+def test_array_values():
+    config = hieropt.Group('config')
+    config.register(hieropt.IntList('ints'))
+    config.register(hieropt.FloatList('floats', [0.5]))
+    config.register(hieropt.BoolList('bools'))
+    config.readfp(sio('config.ints: 1, 2 0x10,010\nconfig.floats: 0.1 2.5\n'
+                      'config.bools: yes, off, 1\n'))
+    assert_equals(list(config.ints()), [1, 2, 16, 8])
+    assert_equals(config.ints().typecode, 'l')
+    assert_equals(list(config.floats()), [0.1, 2.5])
+    assert_equals(list(config.bools()), [1, 0, 1])
+    assert_equals(len(config.floats.view()), 16)
+    fp = sio()
+    config.writefp(fp, annotate=False)
+    assert_equals(fp.getvalue(), 'config.ints: 1, 2, 16, 8\n'
+                                 'config.floats: 0.1, 2.5\n'
+                                 'config.bools: True, False, True\n')
+    copy = hieropt.Group('config')
+    copy.register(hieropt.IntList('ints'))
+    copy.register(hieropt.FloatList('floats'))
+    copy.register(hieropt.BoolList('bools'))
+    copy.readfp(sio(fp.getvalue()))
+    for name in ['ints', 'floats', 'bools']:
+        assert_equals(copy.get(name)(), config.get(name)())
+    config.ints.setFromString('')
+    assert_equals(len(config.ints()), 0)
+    assert_raises(ValueError, config.ints.setFromString, '1, x')
+    assert_raises(ValueError, config.ints.setFromString, str(2**70))
+    assert_raises(ValueError, config.bools.setFromString, 'yes maybe')
+    assert_equals(config.floats.default, array.array('d', [0.5]))
+    config.floats.reset()
+    assert_equals(len(config.floats.view()), 8)
+    config.bools.reset()
+    assert_raises(ValueError, config.bools.view)
+
+def test_layers():
+    simple = makeSimpleWithDefaults()
+    assert_equals(simple.int.layer(), hieropt.DEFAULTS)
+    simple.parseArgs(['--simple-int', '3'])
+    simple.readenv({'SIMPLE_INT': '2'})
+    simple.readfp(sio('simple.int: 1\n'))
+    assert_equals(simple.int(), 3)
+    assert_equals(simple.int.layer(), hieropt.CLI)
+    simple.int.set(4)
+    assert_equals(simple.int(), 4)
+    simple.int.set(None)
+    assert_equals(simple.int(), 3)
+    simple.int.set(None, hieropt.CLI)
+    assert_equals(simple.int(), 2)
+    assert_equals(simple.int.layerValue(hieropt.FILES), 1)
+    assert_equals(simple._dirty, 1)
+    simple.int.reset()
+    assert_equals(simple.int(), 1)
+    assert_equals(simple._dirty, 0)
+    # A value set in only one layer is kept without a dict of layers.
+    simple.readfp(sio('simple.int: 5\n'), lazy=True)
+    assert_equals(simple.int._layers, hieropt.FILES)
+    assert_equals(simple.int.layer(), hieropt.FILES)
+    assert_equals(simple.int.layerValue(hieropt.FILES), 5)
+    assert_equals(simple.int.layerValue(hieropt.ENV), None)
+    simple.int.set(6)
+    simple.int.set(None, hieropt.FILES)
+    assert_equals(simple.int._layers, hieropt.RUNTIME)
+    assert_equals(simple.int(), 6)
+    simple.int.set(None)
+    assert simple.int.isDefault()
+    assert_equals(simple.int.layer(), hieropt.DEFAULTS)
+
+def test_override():
+    config = hieropt.Group('config')
+    config.register(makeSimpleWithDefaults())
+    config.simple.int.register(hieropt.Int('child', hieropt.parent, memoize=True))
+    config.simple.int.set(2)
+    seen = []
+    def other():
+        seen.append(config.simple.int())
+    with config.override({'config.simple.int': 5}):
+        assert_equals(config.simple.int(), 5)
+        assert_equals(config.simple.int.child(), 5)
+        with config.simple.override({'simple.bool': False, 'simple.int': 6}):
+            assert_equals(config.simple.int(), 6)
+            assert_equals(config.simple.bool(), False)
+        assert_equals(config.simple.bool(), True)
+        thread = threading.Thread(target=other)
+        thread.start()
+        thread.join()
+    assert_equals(seen, [2])
+    assert_equals(config.simple.int(), 2)
+    assert_equals(config.simple.int.child(), 2)
+
+def test_fork():
+    config = hieropt.Group('config')
+    config.register(makeSimpleWithDefaults())
+    config.simple.int.register(hieropt.Int('child', hieropt.parent))
+    tenant = config.fork()
+    tenant.simple.int.set(5)
+    assert_equals(tenant.simple.int(), 5)
+    assert_equals(tenant.simple.int.child(), 5)
+    assert_equals(config.simple.int(), 1)
+    assert_equals(config.simple.int.child(), 1)
+    assert not tenant.simple.int.isDefault()
+    assert tenant.simple.bool.isDefault()
+    config.simple.bool.set(False) # Shared, since the fork hasn't set it.
+    assert_equals(tenant.simple.bool(), False)
+    tenant.readfp(sio('config.simple.float: 2.5\n'))
+    assert_equals(tenant.lookup('config.simple.float')(), 2.5)
+    assert_equals(config.simple.float(), 1.0)
+    other = tenant.fork()
+    other.simple.int.reset()
+    assert_equals(other.simple.int(), 1)
+    assert_equals(tenant.simple.int(), 5)
+    assert_equals([name for (name, _) in tenant.variables()],
+                  [name for (name, _) in config.variables()])
+    assert_equals(len(tenant._overrides), 2)
+    assert_raises(hieropt.GroupExpectsNoValue, tenant.simple)
+    assert_raises(hieropt.GroupExpectsNoValue, tenant.simple.set, 1)
+    assert_raises(AttributeError, getattr, tenant, 'nonexistent')
+    assert_equals(tenant.simple.int.type(), 'int')
+    assert_equals([name for (name, _) in tenant.find('config.**.float')],
+                  ['config.simple.float'])
+    assert_equals([(name, node()) for (name, node) in tenant if node.expectsValue()],
+                  [('config.simple.int', 5), ('config.simple.int.child', 5),
+                   ('config.simple.bool', False), ('config.simple.float', 2.5)])
+    fp = sio()
+    tenant.writefp(fp, annotate=False)
+    assert_equals(fp.getvalue(), 'config.simple.int: 5\n'
+                                 '# config.simple.int.child: 5\n'
+                                 'config.simple.bool: False\n'
+                                 'config.simple.float: 2.5\n')
+    fp = sio()
+    config.writefp(fp, annotate=False)
+    assert_equals(fp.getvalue(), '# config.simple.int: 1\n'
+                                 '# config.simple.int.child: 1\n'
+                                 'config.simple.bool: False\n'
+                                 '# config.simple.float: 1.0\n')
+
+def test_fork_flyweight():
+    config = hieropt.Group('config', Child=hieropt.Int, flyweight=True)
+    tenant = config.fork()
+    view = tenant.x
+    tenant.x.set(3)
+    assert_equals(view(), 3)
+    assert_equals(config.x(), None)
+
+def test_subscribe():
+    config = hieropt.Group('config')
+    config.register(makeSimpleWithDefaults())
+    config.simple.int.register(hieropt.Int('child', hieropt.parent, memoize=True))
+    config.register(hieropt.Int('total', lambda: config.simple.int() * 2))
+    batches = []
+    totals = []
+    config.simple.subscribe(batches.append)
+    config.total.subscribe(totals.append)
+    config.readfp(sio('config.simple.int: 2\nconfig.simple.bool: True\n'
+                      'config.simple.float: 1.0\n'))
+    assert_equals(batches, [[('config.simple.int', 1, 2),
+                             ('config.simple.int.child', 1, 2)]])
+    assert_equals(totals, [[('config.total', 2, 4)]])
+    config.simple.bool.set(False)
+    assert_equals(batches[-1], [('config.simple.bool', True, False)])
+    assert_equals(len(totals), 1)
+    with hieropt.Transaction():
+        config.simple.int.set(3)
+        config.simple.int.set(5)
+        config.simple.float.set(1.0)
+    assert_equals(batches[-1], [('config.simple.int', 2, 5),
+                                ('config.simple.int.child', 2, 5)])
+    assert_equals(totals[-1], [('config.total', 4, 10)])
+    config.simple.unsubscribe(batches.append)
+    config.simple.int.set(6)
+    assert_equals(len(batches), 3)
+    assert_equals(totals[-1], [('config.total', 10, 12)])
+    config.total.unsubscribe(totals.append)
+    assert_equals(hieropt._watched, {})
+    assert_equals(hieropt._dependents, {})
+
+def test_subscribe_failing():
+    config = hieropt.Group('config')
+    config.register(hieropt.Int('x', 1))
+    batches = []
+    def fail(changes):
+        raise RuntimeError(changes)
+    config.subscribe(fail)
+    config.x.subscribe(batches.append)
+    assert_raises(RuntimeError, config.x.set, 2)
+    assert_equals(config.x(), 2)
+    assert_equals(batches, [[('config.x', 1, 2)]])
+    config.unsubscribe(fail)
+    config.x.set(3) # Transactions still work after one whose subscriber raised.
+    assert_equals(batches[-1], [('config.x', 2, 3)])
+    config.x.unsubscribe(batches.append)
+
+def test_subscribe_lazy():
+    converted = []
+    class Recording(hieropt.Int):
+        __slots__ = ()
+        def fromString(self, s):
+            converted.append(self._name)
+            return hieropt.Int.fromString(self, s)
+    config = hieropt.Group('config')
+    config.register(Recording('a'))
+    config.register(Recording('b'))
+    config.register(hieropt.Int('c', lambda: config.b() or 0))
+    batches = []
+    config.subscribe(batches.append)
+    config.readfp(sio('config.a: 1\nconfig.b: bad\n'), lazy=True)
+    assert_equals(converted, ['b']) # Only for c's default, which reads it.
+    assert_equals(batches, [[('config.a', None, '1'), ('config.b', None, 'bad')]])
+    assert_equals([name for (name, _) in config.validateAll()], ['config.b'])
+    config.b.set(2)
+    assert_equals(batches[-1], [('config.b', 'bad', 2), ('config.c', 0, 2)])
+    config.unsubscribe(batches.append)
+
+def test_subscribe_batches_reads():
+    config = hieropt.Group('config', Child=hieropt.Int)
+    lines = ''.join(['config.x%s: %s\n' % (i, i) for i in xrange(10000)])
+    for i in xrange(10000):
+        config.get('x%s' % i)
+    batches = []
+    config.subscribe(batches.append)
+    config.readfp(sio(lines))
+    assert_equals(len(batches), 1)
+    assert_equals(len(batches[0]), 10000)
+    config.unsubscribe(batches.append)
+
+def test_find():
+    config = hieropt.Group('config')
+    config.register(hieropt.Group('db'))
+    for name in ['main', 'replica']:
+        db = config.db.register(hieropt.Group(name))
+        db.register(hieropt.Group('pool'))
+        db.pool.register(hieropt.Int('size', 10))
+        db.register(hieropt.Int('timeout', 5))
+    config.register(hieropt.Int('timeout', 30))
+    def names(pattern, group=config):
+        return [name for (name, _) in group.find(pattern)]
+    assert_equals(names('config.db.*.pool.size'),
+                  ['config.db.main.pool.size', 'config.db.replica.pool.size'])
+    assert_equals(names('config.**.timeout'),
+                  ['config.timeout', 'config.db.main.timeout', 'config.db.replica.timeout'])
+    assert_equals(names('config.db.rep*'), ['config.db.replica'])
+    assert_equals(names('config.db.main.**'),
+                  ['config.db.main', 'config.db.main.pool', 'config.db.main.pool.size',
+                   'config.db.main.timeout'])
+    assert_equals(names('db.*.timeout', config.db),
+                  ['db.main.timeout', 'db.replica.timeout'])
+    assert_equals(names('config.nonexistent.*'), [])
+    assert_equals(names('other.**'), [])
+    assert_equals(config.setMatching('config.**.size', '20'),
+                  ['config.db.main.pool.size', 'config.db.replica.pool.size'])
+    assert_equals(config.db.replica.pool.size(), 20)
+    assert_raises(ValueError, config.setMatching, 'config.**', 'x')
+    assert_equals(config.timeout(), 30)
+
+def test_find_flyweight():
+    config = hieropt.Group('config', Child=hieropt.Int, flyweight=True)
+    for i in xrange(3):
+        config.get('t%s' % i)
+    assert_equals(config.setMatching('config.t[12]', '4'), ['config.t1', 'config.t2'])
+    assert_equals(config.t2(), 4)
+    assert_equals(config.t0(), None)
+    assert_raises(ValueError, config.setMatching, 'config.t0', 'x')
+    assert isinstance(config._children['t0'], hieropt.Placeholder)
@@ -0,0 +1,66 @@
+###
+# Copyright (c) 2009, Juju, Inc.
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer. 
+#     * Redistributions in binary form must reproduce the above
+#       copyright notice, this list of conditions and the following
+#       disclaimer in the documentation and/or other materials provided
+#       with the distribution.
+#     * Neither the name of the author of this software nor the names of
+#       the contributors to the software may be used to endorse or
+#       promote products derived from this software without specific
+#       prior written permission. 
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE. 
+###
+
+
+import hieropt
+from hieropt import instrument
+from hieropt.test import *
+
+def test_instrument():
+    call = hieropt.Value.__dict__['__call__']
+    config = hieropt.Group('config')
+    config.register(hieropt.Int('x', default=lambda: 1))
+    config.x.register(hieropt.Int('y', default=hieropt.parent))
+    config.register(hieropt.Float('z'))
+    instrument.enable()
+    try:
+        config.x.y()
+        config.x.y()
+        config.z.setFromString('1.5')
+        config.z()
+    finally:
+        instrument.disable()
+    assert hieropt.Value.__dict__['__call__'] is call
+    config.x.y() # Not counted.
+    stats = instrument.stats(config)
+    assert_equals(stats['config.x.y']['calls'], 2)
+    assert_equals(stats['config.x.y']['defaults'], 2)
+    assert_equals(stats['config.x']['calls'], 2)
+    assert_equals(stats['config.x']['defaults'], 2)
+    assert_equals(stats['config.x']['subtree']['calls'], 4)
+    assert_equals(stats['config.z']['setFromString'], 1)
+    assert_equals(stats['config.z']['conversions'], 1)
+    assert_equals(stats['config']['subtree']['calls'], 5)
+    assert_equals(stats['config']['subtree']['defaults'], 4)
+    assert_equals(config.z(), 1.5)
+    instrument.reset()
+    assert_equals(instrument.stats(config)['config']['subtree']['calls'], 0)
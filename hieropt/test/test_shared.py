@@ -0,0 +1,153 @@
+###
+# Copyright (c) 2009, Juju, Inc.
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer. 
+#     * Redistributions in binary form must reproduce the above
+#       copyright notice, this list of conditions and the following
+#       disclaimer in the documentation and/or other materials provided
+#       with the distribution.
+#     * Neither the name of the author of this software nor the names of
+#       the contributors to the software may be used to endorse or
+#       promote products derived from this software without specific
+#       prior written permission. 
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE. 
+###
+
+
+import os
+import shutil
+import struct
+import marshal
+import tempfile
+from cStringIO import StringIO as sio
+
+import hieropt
+from hieropt import shared
+from hieropt.test import *
+
+def makeConfig():
+    config = hieropt.Group('config')
+    config.register(hieropt.Int('x', 1))
+    config.register(hieropt.Value('name'))
+    config.register(hieropt.FloatList('weights'))
+    return config
+
+def test_shared():
+    directory = tempfile.mkdtemp()
+    filename = os.path.join(directory, 'config.shm')
+    try:
+        master = makeConfig()
+        worker = makeConfig()
+        publisher = shared.Publisher(master, filename, size=4096)
+        subscriber = shared.Subscriber(worker, filename)
+        assert subscriber() is worker
+        assert_equals(worker.x(), 1)
+        master.readfp(sio('config.x: 2\nconfig.name: master\nconfig.weights: 0.5 1.5\n'))
+        assert_equals(publisher.publish(), 1)
+        assert_equals(subscriber().x(), 2)
+        assert_equals(worker.name(), 'master')
+        assert_equals(list(worker.weights()), [0.5, 1.5])
+        assert_equals(worker.x.layer(), hieropt.FILES)
+        assert not subscriber.refresh()
+        master.readfp(sio('config.x: 3\n'))
+        master.name.set(None, hieropt.FILES)
+        master.weights.set(None, hieropt.FILES)
+        publisher.publish()
+        publisher.publish()
+        assert_equals(subscriber.generation(), 3)
+        assert_equals(subscriber().x(), 3)
+        assert worker.name.isDefault()
+        master.readfp(sio('config.name: %s\n' % ('x' * 4096)))
+        assert_raises(ValueError, publisher.publish)
+        subscriber.close()
+        publisher.close()
+    finally:
+        shutil.rmtree(directory)
+
+def test_shared_restarted_publisher():
+    directory = tempfile.mkdtemp()
+    filename = os.path.join(directory, 'config.shm')
+    try:
+        master = makeConfig()
+        worker = makeConfig()
+        publisher = shared.Publisher(master, filename, size=4096)
+        master.readfp(sio('config.x: 2\n'))
+        publisher.publish()
+        subscriber = shared.Subscriber(worker, filename)
+        assert_equals(subscriber().x(), 2)
+        publisher.close()
+        master = makeConfig()
+        publisher = shared.Publisher(master, filename, size=4096)
+        assert_equals(subscriber.generation(), 1)
+        master.readfp(sio('config.x: 9\n'))
+        assert_equals(publisher.publish(), 2)
+        assert_equals(subscriber().x(), 9)
+        subscriber.close()
+        publisher.close()
+    finally:
+        shutil.rmtree(directory)
+
+def test_shared_interleaved():
+    directory = tempfile.mkdtemp()
+    filename = os.path.join(directory, 'config.shm')
+    loads = shared.marshal.loads
+    try:
+        master = makeConfig()
+        master.register(hieropt.Int('y', 1))
+        worker = makeConfig()
+        worker.register(hieropt.Int('y', 1))
+        publisher = shared.Publisher(master, filename, size=4096)
+        subscriber = shared.Subscriber(worker, filename)
+        def publish(n):
+            master.readfp(sio('config.x: %s\nconfig.y: %s\n' % (n, n)))
+            return publisher.publish()
+        publish(1)
+        subscriber.refresh()
+        publish(2)
+        decodes = []
+        def interleave(data):
+            # While generation 2 is decoded, 3 is published to the other slot and 4
+            # starts overwriting the slot being decoded.
+            decodes.append(str(data))
+            if len(decodes) == 1:
+                publish(3)
+                master.readfp(sio('config.x: 4\nconfig.y: 4\n'))
+                data = marshal.dumps(master._snapshotValues(), 2)
+                header = shared._SLOTS
+                sequence = struct.unpack_from('Q', publisher._map, header)[0]
+                struct.pack_into('Q', publisher._map, header, sequence | 1)
+                start = shared._HEADER
+                publisher._map[start:start+len(data)//2] = data[:len(data)//2]
+            return loads(data)
+        shared.marshal.loads = interleave
+        try:
+            assert subscriber.refresh()
+        finally:
+            shared.marshal.loads = loads
+        assert_equals(len(decodes), 2)
+        assert_equals(subscriber._generation, 3)
+        assert_equals((worker.x(), worker.y()), (3, 3))
+        assert_equals(publisher.publish(), 4) # Finishes the interrupted write.
+        assert subscriber.refresh()
+        assert_equals((worker.x(), worker.y()), (4, 4))
+        subscriber.close()
+        publisher.close()
+    finally:
+        shutil.rmtree(directory)
@@ -34,7 +34,7 @@ from setuptools import setup, find_packages
 setup(
     name = "hieropt",
     version = "0.2",
-    packages = ['hieropt', 'hieropt.test'],
+    packages = ['hieropt', 'hieropt.test', 'hieropt.bench'],
 
     author = 'Jeremy Fincher',
     author_email = 'jemfinch@finchers.us',